@@ -1,66 +1,171 @@
 # app.py
-from flask import Flask, render_template, request, send_file, url_for, redirect
+from flask import Flask, Response, render_template, request, send_file, stream_with_context, url_for, redirect
+import itertools
+import json
+import os
 import random
 import io
-import traceback 
 
-from midi_generator import UKHitFactory
+from generation_pool import GenerationPool, GenerationTimeout, PoolBusy, render_song
+from midi_cache import MidiCache, cache_key
+from midi_generator import GENERATOR_VERSION, UKHitFactory, song_title_for_seed
+from song_params import ParameterError, SongParams
+from warm_pool import WarmPool
 
 app = Flask(__name__)
+app.config['MIDI_CACHE_MAX_BYTES'] = int(os.environ.get('MIDI_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+app.config['MIDI_CACHE_DIR'] = os.environ.get('MIDI_CACHE_DIR') or None # Unset = memory tier only
+app.config['MIDI_CACHE_DISK_MAX_BYTES'] = int(os.environ.get('MIDI_CACHE_DISK_MAX_BYTES', 256 * 1024 * 1024))
+app.config['MIDI_CACHE_MAX_AGE'] = int(os.environ.get('MIDI_CACHE_MAX_AGE', 86400))
+app.config['MIDI_PROFILE_LAYERS'] = os.environ.get('MIDI_PROFILE_LAYERS', '') == '1' # Log per-layer timings for every rendered song
+app.config['MIDI_POOL_WORKERS'] = int(os.environ.get('MIDI_POOL_WORKERS', 0)) # 0 = compose in the request thread
+app.config['MIDI_POOL_MAX_QUEUED'] = int(os.environ['MIDI_POOL_MAX_QUEUED']) if os.environ.get('MIDI_POOL_MAX_QUEUED') else None # Default: 2 per worker
+app.config['MIDI_POOL_TIMEOUT'] = float(os.environ.get('MIDI_POOL_TIMEOUT', 30))
+app.config['MIDI_WARM_POOL_SIZE'] = int(os.environ.get('MIDI_WARM_POOL_SIZE', 0)) # Pre-rendered songs per combination; 0 = off
+app.config['MIDI_WARM_POOL_MAX_BYTES'] = int(os.environ.get('MIDI_WARM_POOL_MAX_BYTES', 16 * 1024 * 1024))
+
+# Rendered songs are deterministic per (params, GENERATOR_VERSION), so they can be cached and served by ETag.
+midi_cache = MidiCache(max_bytes=app.config['MIDI_CACHE_MAX_BYTES'], disk_dir=app.config['MIDI_CACHE_DIR'],
+                       disk_max_bytes=app.config['MIDI_CACHE_DISK_MAX_BYTES'])
+# With workers configured, composition runs in a bounded process pool so request threads stay free for cheap routes.
+generation_pool = GenerationPool(max_workers=app.config['MIDI_POOL_WORKERS'], max_queued=app.config['MIDI_POOL_MAX_QUEUED'],
+                                 timeout=app.config['MIDI_POOL_TIMEOUT']) if app.config['MIDI_POOL_WORKERS'] > 0 else None
+# Seedless requests for a common genre x mood x length are served pre-rendered songs, refilled in the background.
+warm_pool = WarmPool(size=app.config['MIDI_WARM_POOL_SIZE'], max_bytes=app.config['MIDI_WARM_POOL_MAX_BYTES'],
+                     generation_pool=generation_pool) if app.config['MIDI_WARM_POOL_SIZE'] > 0 else None
+
+@app.before_request
+def _start_warm_pool():
+    # Started by the first request rather than at import: the debug reloader imports this module in a watcher
+    # process that never serves, and only the serving process should render refills. start() is idempotent.
+    if warm_pool is not None: warm_pool.start()
 
 @app.route('/', methods=['GET'])
 def index():
     return render_template('index.html')
 
+def _generation_params_from(form, warm_pool=None):
+    """
+    Validates submitted form/query values into UKHitFactory params; returns (params, seed_is_explicit, warm_song).
+    Without a seed, a stocked warm_pool supplies a pre-rendered WarmSong and its seed; otherwise warm_song is None.
+    surprise=1 (the "Surprise Me" button) asks for any song, so the pool may serve any stocked combination instead.
+    Raises ParameterError for anything out of range or not one of the enumerated choices.
+    """
+    song_params = SongParams.from_mapping(form)
+    seed_is_explicit = song_params.seed is not None
+    warm_song = None
+    if warm_pool is not None and not seed_is_explicit:
+        warm_song = warm_pool.take_any() if form.get('surprise') == '1' else warm_pool.take(song_params)
+        if warm_song is not None: song_params = warm_song.song_params
+    if not seed_is_explicit: song_params = song_params.with_seed(warm_song.seed if warm_song is not None else random.randint(0, 1000000))
+    return song_params.as_dict(), seed_is_explicit, warm_song
+
+def _invalid_request(error):
+    app.logger.info("Rejected generation request: %s", error, extra={'event': "generate_invalid", 'field': error.field})
+    return Response(f"Invalid parameter {error}", status=400, mimetype='text/plain')
+
 @app.route('/generate', methods=['GET', 'POST'])
 def generate_hit():
-    if request.method == 'GET':
+    # GET with a query string is allowed so seeded songs have cacheable URLs (browser/CDN revalidation).
+    # rerolls=Chorus:melody:1 (comma-separated section:layer:variation entries) re-rolls single units of the seeded song
+    # (not in render_mode=sequential); the rest come from generation_pool.unit_cache when the song was rendered before.
+    form = request.form if request.method == 'POST' else request.args
+    if request.method == 'GET' and not form:
         return redirect(url_for('index'))
 
     try:
-        seed_input = request.form.get('seed')
-        if seed_input and seed_input.isdigit():
-            current_seed = int(seed_input)
-        else:
-            current_seed = random.randint(0, 1000000)
-        
-        generation_params = {
-            'seed': current_seed,
-            'primary_genre': request.form.get('primary_genre', 'ModernPop'),
-            'mood': request.form.get('mood', 'UpliftingEnergetic'),
-            'energy_level': int(request.form.get('energy_level', 3)),
-            'tempo_preference': request.form.get('tempo_preference', 'Medium'),
-            'song_length': request.form.get('song_length', 'Radio'),
-            'structural_complexity': request.form.get('structural_complexity', 'Standard'),
-            'melodic_complexity': int(request.form.get('melodic_complexity', 3)),
-            'harmonic_richness': request.form.get('harmonic_richness', 'Some7ths'),
-            'instrumentation_focus': request.form.get('instrumentation_focus', 'Balanced'),
-            # READ THE NEW PARAMETER
-            'melody_generation_style': request.form.get('melody_generation_style', 'Standard') 
-        }
+        generation_params, seed_is_explicit, warm_song = _generation_params_from(form, warm_pool)
+    except ParameterError as e:
+        return _invalid_request(e)
+
+    try:
+        current_seed = generation_params['seed']
         
-        print(f"Received generation parameters: {generation_params}")
+        app.logger.debug("Received generation parameters: %s", generation_params, extra={'event': "generate_request", 'params': generation_params})
 
-        hit_generator = UKHitFactory(user_params=generation_params)
-        hit_generator.compose()
+        etag = cache_key(generation_params, GENERATOR_VERSION)
+        if etag in request.if_none_match:
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag)
+            return not_modified
 
-        midi_buffer = io.BytesIO()
-        hit_generator.midi_obj.writeFile(midi_buffer)
-        midi_buffer.seek(0)
+        # Random-seed songs are effectively never requested again, so only explicit seeds use the cache.
+        midi_bytes = midi_cache.get(etag) if seed_is_explicit else (warm_song.midi_bytes if warm_song is not None else None)
+        if midi_bytes is None:
+            if generation_pool is not None: midi_bytes, profiler = generation_pool.render(generation_params, app.config['MIDI_PROFILE_LAYERS'])
+            else: midi_bytes, profiler = render_song(generation_params, app.config['MIDI_PROFILE_LAYERS'])
+            if profiler is not None:
+                app.logger.info("Layer profile for %s: dominant layer %s", generation_params['primary_genre'], profiler.dominant_layer(),
+                                extra={'event': "layer_profile", 'params': generation_params, 'layers': profiler.by_layer()})
+            if seed_is_explicit: midi_cache.put(etag, midi_bytes)
 
-        song_title_for_file = hit_generator.song_title.replace(" ", "_").replace(":", "-") + ".mid"
+        song_title_for_file = song_title_for_seed(current_seed).replace(" ", "_").replace(":", "-") + ".mid"
 
-        return send_file(
-            midi_buffer,
+        response = send_file(
+            io.BytesIO(midi_bytes),
             as_attachment=True,
             download_name=song_title_for_file,
-            mimetype='audio/midi'
+            mimetype='audio/midi',
+            etag=etag,
+            max_age=app.config['MIDI_CACHE_MAX_AGE'] if seed_is_explicit else None
         )
+        if not seed_is_explicit:
+            response.cache_control.no_store = True # A random seed means this URL gives a different song every time
+        return response
 
+    except ParameterError as e:
+        return _invalid_request(e) # e.g. rerolls naming a section or layer this song doesn't have
+    except PoolBusy as e:
+        app.logger.warning("Generation pool full, rejecting request", extra={'event': "generate_rejected", 'pool': generation_pool.stats()})
+        return Response(f"The server is busy composing other songs. Please try again in {e.retry_after}s.", status=503, headers={'Retry-After': str(e.retry_after)})
+    except GenerationTimeout:
+        return Response("Song generation took too long. Please try again.", status=503, headers={'Retry-After': str(generation_pool.retry_after())})
     except Exception as e:
-        print(f"Error during MIDI generation (app.py): {e}")
-        traceback.print_exc() 
+        app.logger.exception("Error during MIDI generation: %s", e, extra={'event': "generate_failed"})
         return f"An error occurred during MIDI generation: {str(e)} <br><a href='{url_for('index')}'>Try again</a>", 500
 
+@app.route('/stats', methods=['GET'])
+def service_stats():
+    """ Cache, generation pool and warm pool counters (hits, misses, sizes) as JSON. """
+    return {'midi_cache': midi_cache.stats(), 'generation_pool': generation_pool.stats() if generation_pool is not None else None,
+            'warm_pool': warm_pool.stats() if warm_pool is not None else None}
+
+def _max_sections_from(form):
+    """ Optional max_sections: None (no limit) or an integer >= 0. Raises ParameterError otherwise. """
+    value = form.get('max_sections', '').strip()
+    if not value: return None
+    try: max_sections = int(value)
+    except ValueError: raise ParameterError('max_sections', f"expected an integer, got {value!r}") from None
+    if max_sections < 0: raise ParameterError('max_sections', f"must be at least 0, got {max_sections}")
+    return max_sections
+
+@app.route('/preview', methods=['GET', 'POST'])
+def preview_hit():
+    """
+    Live-preview feed: streams newline-delimited JSON, a song header first and then one line per section
+    as soon as it is composed. Optional max_sections stops composition early.
+    """
+    form = request.form if request.method == 'POST' else request.args
+    try:
+        generation_params, _, _ = _generation_params_from(form)
+        max_sections = _max_sections_from(form)
+        hit_generator = UKHitFactory(user_params=generation_params)
+        # Rerolls are matched against the song's sections while planning; do it now so a bad one is a 400, not a broken stream.
+        if hit_generator.params['render_mode'] == "units": hit_generator.plan()
+    except ParameterError as e:
+        return _invalid_request(e)
+    except Exception as e:
+        return f"Invalid preview request: {str(e)}", 400
+
+    def stream_sections():
+        params = hit_generator.params
+        yield json.dumps({'title': hit_generator.song_title, 'seed': hit_generator.seed, 'bpm': params['bpm'], 'key': params['key_name_original'],
+                          'song_form': params['song_form'], 'instruments': params['instruments'], 'track_map': hit_generator.track_map}) + "\n"
+        for section in itertools.islice(hit_generator.iter_sections(), max_sections):
+            del section['event_range']
+            yield json.dumps(section) + "\n"
+
+    return Response(stream_with_context(stream_sections()), mimetype='application/x-ndjson')
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True, threaded=True)
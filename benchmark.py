@@ -0,0 +1,167 @@
+# benchmark.py
+"""
+Benchmark suite for UKHitFactory: sweeps the parameter space the web form exposes over fixed seeds and
+reports per-phase timings, notes per second and peak memory, with JSON output and baseline comparison.
+
+    python benchmark.py --output results.json
+    python benchmark.py --matrix full --seeds 1,2,3 --output results.json --baseline baseline.json --threshold 0.10
+"""
+import argparse
+import io
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from midi_generator import GENERATOR_VERSION, MIDI_WRITERS, UKHitFactory
+
+PARAMETER_SPACE = {
+    'primary_genre': ["ModernPop", "PopRock", "EDMPulse", "HipHopGroove", "Ballad", "RetroSynthwave"],
+    'structural_complexity': ["Simple", "Standard", "Developed"],
+    'song_length': ["Short", "Radio", "Standard", "Extended"],
+    'melody_generation_style': ["Standard", "ContourDriven", "MarkovChain"],
+    'harmonic_richness': ["TriadsOnly", "Some7ths", "Mostly7ths"],
+    'instrumentation_focus': ["Balanced", "PianoLed", "SynthHeavy", "GuitarFocused", "Minimalist"],
+}
+BASE_PARAMS = {
+    'primary_genre': "ModernPop", 'mood': "UpliftingEnergetic", 'energy_level': 3, 'tempo_preference': "Medium",
+    'song_length': "Radio", 'structural_complexity': "Standard", 'melodic_complexity': 3, 'harmonic_richness': "Some7ths",
+    'instrumentation_focus': "Balanced", 'melody_generation_style': "Standard",
+}
+DEFAULT_SEEDS = (1, 2, 3)
+PHASES = ("parameter_init", "chord_progression", "drums", "bass", "chords", "melody", "pad", "other", "serialization")
+
+def build_matrix(kind="quick"):
+    """
+    Returns [(case_id, params)]. "quick" varies one dimension at a time around BASE_PARAMS;
+    "full" is the cartesian product of PARAMETER_SPACE.
+    """
+    if kind == "full":
+        names = list(PARAMETER_SPACE)
+        return [("/".join(values), {**BASE_PARAMS, **dict(zip(names, values))}) for values in itertools.product(*PARAMETER_SPACE.values())]
+    cases = [("base", dict(BASE_PARAMS))]
+    for name, values in PARAMETER_SPACE.items():
+        for value in values:
+            if value != BASE_PARAMS[name]: cases.append((f"{name}={value}", {**BASE_PARAMS, name: value}))
+    return cases
+
+class _PhaseTimer:
+    """ Profiler (see profiling.py) that adds each top-level layer call's wall time to phase_seconds. """
+    def __init__(self, phase_seconds):
+        self.phase_seconds = phase_seconds
+
+    def record(self, section_index, section_type, layer, seconds, notes, rng_draws):
+        if layer in self.phase_seconds: self.phase_seconds[layer] += seconds
+
+def run_song(params, seed):
+    """ Composes and serializes one song through the factory's profiling hooks; returns (phase_seconds, note_count, midi_bytes). """
+    phase_seconds = dict.fromkeys(PHASES, 0.0)
+    started = time.perf_counter()
+    hit_generator = UKHitFactory(user_params={**params, 'seed': seed}, profiler=_PhaseTimer(phase_seconds))
+    phase_seconds['parameter_init'] = time.perf_counter() - started
+    started = time.perf_counter()
+    hit_generator.compose()
+    compose_seconds = time.perf_counter() - started
+    phase_seconds['other'] = max(0.0, compose_seconds - sum(phase_seconds[p] for p in ("chord_progression", "drums", "bass", "chords", "melody", "pad")))
+    midi_buffer = io.BytesIO()
+    started = time.perf_counter()
+    hit_generator.write_midi(midi_buffer)
+    phase_seconds['serialization'] = time.perf_counter() - started
+    return phase_seconds, len(hit_generator.notes), midi_buffer.getvalue()
+
+def check_song(params, seed, midi_bytes):
+    """
+    Raises RuntimeError unless a benchmarked song is byte-identical to a plain compose() of the same params, and
+    to what midiutil writes for it (the native writer's output must never differ).
+    """
+    hit_generator = UKHitFactory(user_params={**params, 'seed': seed})
+    hit_generator.compose()
+    for writer in MIDI_WRITERS:
+        midi_buffer = io.BytesIO(); hit_generator.write_midi(midi_buffer, writer=writer)
+        if midi_buffer.getvalue() != midi_bytes: raise RuntimeError(f"Benchmarked song for seed {seed} differs from compose() with writer={writer!r} for {params}")
+
+def peak_memory(params, seed):
+    """ Peak traced allocation for one compose+serialize (run separately: tracemalloc distorts timings). """
+    tracemalloc.start()
+    try:
+        hit_generator = UKHitFactory(user_params={**params, 'seed': seed})
+        hit_generator.compose()
+        hit_generator.write_midi(io.BytesIO())
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_benchmarks(matrix="quick", seeds=DEFAULT_SEEDS, repeat=3, measure_memory=True):
+    """
+    Runs every case in the matrix for every seed, `repeat` times, keeping the fastest repeat per song.
+    Returns a JSON-serializable results dict; phase timings are per-song means in seconds.
+    """
+    results = {'generator_version': GENERATOR_VERSION, 'python': platform.python_version(), 'matrix': matrix,
+               'seeds': list(seeds), 'repeat': repeat, 'cases': {}}
+    for case_id, params in build_matrix(matrix):
+        per_song = []; notes = 0
+        for seed in seeds:
+            runs = [run_song(params, seed) for _ in range(repeat)]
+            check_song(params, seed, runs[0][2]) # Timing must never change the song being timed
+            phase_seconds, note_count, _ = min(runs, key=lambda run: sum(run[0].values()))
+            per_song.append(phase_seconds); notes += note_count
+        phases = {phase: statistics.fmean(song[phase] for song in per_song) for phase in PHASES}
+        total_seconds = sum(phases.values())
+        case = {'params': params, 'phases': phases, 'total_seconds': total_seconds,
+                'notes_per_song': notes / len(seeds), 'notes_per_second': (notes / len(seeds)) / total_seconds if total_seconds else 0.0}
+        if measure_memory: case['peak_memory_bytes'] = max(peak_memory(params, seed) for seed in seeds)
+        results['cases'][case_id] = case
+    results['total_seconds'] = sum(case['total_seconds'] for case in results['cases'].values())
+    return results
+
+def compare_to_baseline(results, baseline, threshold=0.10):
+    """ Returns regression descriptions for cases (and the overall total) slower than baseline by more than threshold. """
+    regressions = []
+    for case_id, case in results['cases'].items():
+        base_case = baseline.get('cases', {}).get(case_id)
+        if base_case and case['total_seconds'] > base_case['total_seconds'] * (1 + threshold):
+            regressions.append(f"{case_id}: {base_case['total_seconds'] * 1000:.2f}ms -> {case['total_seconds'] * 1000:.2f}ms "
+                               f"(+{(case['total_seconds'] / base_case['total_seconds'] - 1) * 100:.1f}%)")
+    if baseline.get('total_seconds') and results['total_seconds'] > baseline['total_seconds'] * (1 + threshold):
+        regressions.append(f"overall: {baseline['total_seconds']:.3f}s -> {results['total_seconds']:.3f}s")
+    return regressions
+
+def _print_report(results):
+    header = f"{'case':42} {'total ms':>9} {'notes/s':>9} {'peak KiB':>9}  " + " ".join(f"{p[:8]:>8}" for p in PHASES)
+    print(header); print("-" * len(header))
+    for case_id, case in results['cases'].items():
+        peak = case.get('peak_memory_bytes')
+        print(f"{case_id[:42]:42} {case['total_seconds'] * 1000:9.2f} {case['notes_per_second']:9.0f} {peak / 1024 if peak else 0:9.0f}  "
+              + " ".join(f"{case['phases'][p] * 1000:8.2f}" for p in PHASES))
+    print(f"Overall: {results['total_seconds']:.3f}s across {len(results['cases'])} cases (per-phase columns in ms per song)")
+    serialization = sum(case['phases']['serialization'] for case in results['cases'].values())
+    if results['total_seconds'] > serialization: print(f"Serialization: {serialization / (results['total_seconds'] - serialization) * 100:.0f}% of compose time")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark UKHitFactory across genres, forms and melody styles.")
+    parser.add_argument("--matrix", choices=("quick", "full"), default="quick", help="quick: one dimension at a time; full: cartesian product")
+    parser.add_argument("--seeds", default=",".join(str(s) for s in DEFAULT_SEEDS), help="Comma-separated fixed seeds")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per song; the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory pass")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against a saved results JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown vs baseline before failing (fraction)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.matrix, [int(s) for s in args.seeds.split(",") if s.strip()], args.repeat, not args.no_memory)
+    _print_report(results)
+    if args.output:
+        with open(args.output, "w") as f: json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        for line in regressions: print(f"REGRESSION {line}")
+        if regressions: return 1
+        print(f"No regressions beyond {args.threshold * 100:.0f}% of baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
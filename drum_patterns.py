@@ -0,0 +1,84 @@
+# drum_patterns.py
+"""
+Drum kits, grooves and fills for UKHitFactory._add_drum_pattern, compiled once at import. A groove is a DrumPattern
+of tick offsets within the bar, so a bar's fixed hits go into the NoteEventBuffer as one addPattern() call; only the
+hits that draw from the RNG (HipHop ghost kicks and hats, Ballad and build-up hats, fills) are still placed one by one.
+"""
+from array import array
+from typing import NamedTuple
+
+from note_events import TICKS_PER_QUARTERNOTE
+
+class DrumKit(NamedTuple):
+    kick: int
+    snare: int
+    closed_hh: int
+    open_hh: int
+
+KITS = {"HipHopGroove": DrumKit(35, 40, 22, 26), "EDMPulse": DrumKit(36, 38, 42, 46)}
+DEFAULT_KIT = DrumKit(36, 38, 42, 46)
+CRASH, RIDE = 49, 51
+
+# Velocity slots: a pattern stores one per hit and addPattern() maps them through the bar's (kick, snare, hat, bar) velocities.
+KICK_VEL, SNARE_VEL, HAT_VEL, BAR_VEL = range(4)
+
+class DrumPattern(NamedTuple):
+    pitches: array
+    offsets: array   # Ticks from the start of the bar
+    durations: array # Ticks
+    velocity_slots: tuple
+
+def _compile(hits):
+    """ hits: (pitch, offset_beats, duration_beats, velocity_slot) in insertion order. """
+    return DrumPattern(array('B', (pitch for pitch, _, _, _ in hits)), array('q', (int(offset * TICKS_PER_QUARTERNOTE) for _, offset, _, _ in hits)),
+                       array('q', (int(duration * TICKS_PER_QUARTERNOTE) for _, _, duration, _ in hits)), tuple(slot for _, _, _, slot in hits))
+
+# Hat grid positions (beats into the bar) for each subdivision.
+HAT_STEPS = {subdivision: tuple(i * subdivision for i in range(int(4 / subdivision))) for subdivision in (1.0, 0.5, 0.25)}
+HIPHOP_HAT_STEPS = HAT_STEPS[0.25]
+HIPHOP_GHOST_KICKS = ((0.75, 1.5, 1.75), (2.5, 2.75, 3.5)) # Optional extra kick after beat 1 / after beat 3
+
+def _edm_groove(kit):
+    return _compile([(kit.kick, beat, 0.5, KICK_VEL) for beat in range(4)] + [(kit.snare, 1, 0.5, SNARE_VEL), (kit.snare, 3, 0.5, SNARE_VEL)]
+                    + [(kit.closed_hh, beat, 0.25, HAT_VEL) for beat in (0.5, 1.5, 2.5, 3.5)])
+
+def _backbeat(kit, hat_subdivision=None):
+    hits = [(kit.kick, 0, 1, KICK_VEL), (kit.snare, 1, 1, SNARE_VEL), (kit.kick, 2, 1, KICK_VEL), (kit.snare, 3, 1, SNARE_VEL)]
+    if hat_subdivision: hits += [(kit.closed_hh, offset, hat_subdivision, HAT_VEL) for offset in HAT_STEPS[hat_subdivision]]
+    return _compile(hits)
+
+EDM_GROOVE = _edm_groove(KITS["EDMPulse"])
+BACKBEAT = _backbeat(DEFAULT_KIT)
+# Backbeat plus a straight closed-hat grid, for bars whose hats involve no random choices.
+BACKBEAT_WITH_HATS = {subdivision: _backbeat(DEFAULT_KIT, subdivision) for subdivision in HAT_STEPS}
+
+# Fills: (note, beats before the end of the bar, duration). Some fills only exist for one rhythm personality.
+FILLS = {
+    "standard_snare_roll": ((38, 1.0, 0.25), (38, 0.75, 0.25), (38, 0.5, 0.25), (38, 0.25, 0.25)),
+    "tom_roll_simple": ((48, 1.0, 0.33), (45, 0.66, 0.33), (41, 0.33, 0.33)),
+    "hiphop_stutter_snare": ((40, 1.0, 0.125), (22, 0.875, 0.125), (40, 0.75, 0.125), (22, 0.625, 0.125), (40, 0.5, 0.125), (22, 0.375, 0.125), (40, 0.25, 0.125)),
+    "edm_noise_sweep": ((46, 1.0, 0.25), (46, 0.75, 0.25), (46, 0.5, 0.25), (46, 0.25, 0.25)),
+    "kick_and_cymbal_transition": ((36, 1.0, 0.5), (49, 0.5, 0.5)),
+    "sparse_tom_accent": ((45, 0.5, 0.25), (41, 0.25, 0.25)),
+    "syncopated_snare_pop": ((38, 1.0, 0.25), (38, 0.5, 0.25)),
+}
+FILL_PERSONALITY = {"hiphop_stutter_snare": "HipHopGroove", "edm_noise_sweep": "EDMPulse"}
+DEFAULT_FILL = ((38, 1.0, 0.25), (38, 0.75, 0.25))
+
+def fill_pattern(fill_type, rhythm_personality):
+    fill = FILLS.get(fill_type)
+    if fill is None or FILL_PERSONALITY.get(fill_type, rhythm_personality) != rhythm_personality: return DEFAULT_FILL
+    return fill
+
+# Fill choices. Order matters: they are rng.choice()d.
+_SECTION_END_FILLS = ("standard_snare_roll", "tom_roll_simple", "kick_and_cymbal_transition", "syncopated_snare_pop")
+SECTION_END_FILLS = {"HipHopGroove": _SECTION_END_FILLS + ("hiphop_stutter_snare",), "EDMPulse": _SECTION_END_FILLS + ("edm_noise_sweep",)}
+BALLAD_SECTION_END_FILLS = ("sparse_tom_accent", "kick_and_cymbal_transition")
+
+def section_end_fills(rhythm_personality, is_ballad):
+    if rhythm_personality in SECTION_END_FILLS: return SECTION_END_FILLS[rhythm_personality]
+    return BALLAD_SECTION_END_FILLS if is_ballad else _SECTION_END_FILLS
+
+def phrase_fills(rhythm_personality):
+    """ Fills for the end of a four-bar phrase inside a section; only their last two beats are played. """
+    return ("sparse_tom_accent", "syncopated_snare_pop") if rhythm_personality == "EDMPulse" else ("sparse_tom_accent", "syncopated_snare_pop", "standard_snare_roll")
@@ -0,0 +1,143 @@
+# generation_pool.py
+"""
+Bounded process pool for the web service. compose() plus serialization run in worker processes, so a slow song
+never holds the GIL that request threads serving / or cached downloads need, and one service process can use
+every core. Admission is a counting semaphore over running + queued jobs: past that limit render() raises PoolBusy
+(the app answers 503 with Retry-After) instead of growing an unbounded queue.
+"""
+import io
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from midi_generator import UKHitFactory
+from profiling import CompositionProfiler
+from song_plan import UnitCache
+
+logger = logging.getLogger(__name__)
+
+# Rendered units of "units" mode songs, per process, so a re-roll of one (section, layer) renders only that unit
+# when the song was rendered in the same process before.
+unit_cache = UnitCache(max_events=int(os.environ.get('MIDI_UNIT_CACHE_EVENTS', 500_000)))
+
+class PoolBusy(Exception):
+    """ Every worker is busy and the queue is full; retry_after is a whole-second estimate of when a slot frees up. """
+    def __init__(self, retry_after):
+        super().__init__(f"Generation queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class GenerationTimeout(Exception):
+    pass
+
+def render_song(generation_params, profile_layers=False):
+    """ Composes and serializes one song; returns (midi_bytes, CompositionProfiler or None). Runs in a worker process or inline. """
+    profiler = CompositionProfiler() if profile_layers else None
+    hit_generator = UKHitFactory(user_params=generation_params, profiler=profiler, unit_cache=unit_cache)
+    hit_generator.compose()
+    midi_buffer = io.BytesIO()
+    hit_generator.write_midi(midi_buffer)
+    return midi_buffer.getvalue(), profiler
+
+class GenerationPool:
+    """
+    max_workers processes plus up to max_queued waiting jobs. A job that outlives its timeout is cancelled if it
+    has not started; one already running cannot be interrupted, so it keeps its admission slot until it finishes
+    and the pool never accepts more work than it can actually hold. The executor is created on first use.
+    Background jobs (warm-pool refills) yield to requests: one is only admitted while a worker is idle and fewer
+    than max_background of them are pending, so they never queue ahead of a request or hold more slots than that.
+    """
+    def __init__(self, max_workers=None, max_queued=None, timeout=30.0, max_background=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queued = self.max_workers * 2 if max_queued is None else max_queued
+        self.max_background = max(1, self.max_workers // 2) if max_background is None else max_background
+        self.background_pending = 0
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queued)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0; self.completed = 0; self.rejected = 0; self.timed_out = 0
+        self._mean_seconds = 1.0 # Running mean of job latency, for Retry-After estimates
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None: self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _reset_executor(self, broken):
+        with self._lock:
+            if self._executor is broken: self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, started, background):
+        def on_done(future):
+            elapsed = max(0.0, time.monotonic() - started)
+            with self._lock:
+                self.pending -= 1; self.completed += 1
+                if background: self.background_pending -= 1
+                self._mean_seconds += (elapsed - self._mean_seconds) * 0.2
+            self._slots.release()
+        return on_done
+
+    def _admit_background(self):
+        with self._lock:
+            if self.pending >= self.max_workers or self.background_pending >= self.max_background:
+                self.rejected += 1; return False
+            self.background_pending += 1; return True
+
+    def _release_background(self):
+        with self._lock: self.background_pending -= 1
+
+    def retry_after(self):
+        with self._lock: return max(1, math.ceil(self._mean_seconds * (self.pending / self.max_workers)))
+
+    def render(self, generation_params, profile_layers=False, timeout=None, background=False):
+        """
+        render_song() in a worker. Raises PoolBusy when full, GenerationTimeout after timeout seconds (default: the pool's).
+        background=True marks a job that must not compete with requests (see the class docstring); it gets PoolBusy instead.
+        """
+        if background and not self._admit_background(): raise PoolBusy(self.retry_after())
+        if not self._slots.acquire(blocking=False):
+            with self._lock: self.rejected += 1
+            if background: self._release_background()
+            raise PoolBusy(self.retry_after())
+        executor = self._get_executor()
+        try:
+            future = executor.submit(render_song, generation_params, profile_layers)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool and retry once.
+            self._reset_executor(executor)
+            try: future = self._get_executor().submit(render_song, generation_params, profile_layers)
+            except BaseException:
+                self._slots.release()
+                if background: self._release_background()
+                raise
+        except BaseException:
+            self._slots.release()
+            if background: self._release_background()
+            raise
+        with self._lock: self.pending += 1
+        future.add_done_callback(self._finished(time.monotonic(), background))
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock: self.timed_out += 1
+            logger.warning("Generation timed out after %ss", self.timeout if timeout is None else timeout,
+                           extra={'event': "generate_timeout", 'params': generation_params})
+            raise GenerationTimeout("Song generation timed out") from None
+        except BrokenProcessPool:
+            self._reset_executor(executor); raise
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.max_workers, 'max_queued': self.max_queued, 'pending': self.pending, 'completed': self.completed,
+                    'rejected': self.rejected, 'timed_out': self.timed_out, 'mean_seconds': round(self._mean_seconds, 4),
+                    'background_pending': self.background_pending, 'max_background': self.max_background}
+
+    def shutdown(self, wait=True):
+        with self._lock: executor, self._executor = self._executor, None
+        if executor is not None: executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,93 @@
+# melody_generators/__init__.py
+"""
+Melody generator registry. A generator is registered under the name used by the melody_generation_style param,
+either lazily as a "module:function" path (imported the first time it is resolved), with the @melody_generator
+decorator, or by an installed package through the "ukhitfactory.melody_generators" entry-point group.
+Every generator takes (midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params),
+where factory_params is the song's MelodyContext (see context.py). A generator registered with the "motifs"
+capability also defines create_hook_motif() in its module; see hook_motif_factory().
+"""
+import importlib
+import logging
+import threading
+from dataclasses import dataclass
+
+from melody_generators.context import MelodyContext, MelodyNote
+
+__all__ = ["ENTRY_POINT_GROUP", "DEFAULT_GENERATOR", "GeneratorSpec", "MelodyContext", "MelodyNote", "register", "melody_generator",
+           "available", "resolve", "hook_motif_factory"]
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "ukhitfactory.melody_generators"
+DEFAULT_GENERATOR = "Standard"
+
+@dataclass(frozen=True)
+class GeneratorSpec:
+    name: str
+    target: object # "package.module:function", or the callable itself
+    capabilities: frozenset = frozenset()
+    description: str = ""
+
+_registry = {}
+_resolved = {}
+_lock = threading.Lock()
+_entry_points_loaded = False
+
+def register(name, target, capabilities=(), description=""):
+    """ Registers (or replaces) a generator. target is a callable or a lazy "module:function" path. """
+    with _lock:
+        _registry[name] = GeneratorSpec(name, target, frozenset(capabilities), description)
+        _resolved.pop(name, None)
+
+def melody_generator(name, capabilities=(), description=""):
+    """ Decorator form of register() for generators defined in-process. """
+    def decorate(generate):
+        register(name, generate, capabilities, description)
+        return generate
+    return decorate
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded: return
+    _entry_points_loaded = True
+    from importlib.metadata import entry_points
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name not in _registry: register(entry_point.name, entry_point.value)
+
+def available():
+    """ {name: GeneratorSpec} for every registered generator, including installed entry points. Imports nothing. """
+    _load_entry_points()
+    return dict(_registry)
+
+def resolve(name):
+    """ Returns the generate callable for name, importing its module on first use. Unknown names fall back to Standard. """
+    generate = _resolved.get(name)
+    if generate is not None: return generate
+    spec = _registry.get(name)
+    if spec is None:
+        _load_entry_points(); spec = _registry.get(name)
+    if spec is None:
+        logger.debug("Unknown melody generator %s, using %s", name, DEFAULT_GENERATOR, extra={'event': "melody_fallback", 'method': name})
+        return resolve(DEFAULT_GENERATOR)
+    generate = spec.target
+    if isinstance(generate, str):
+        module_name, _, attribute = generate.partition(":")
+        generate = getattr(importlib.import_module(module_name), attribute or "generate")
+    with _lock: _resolved[name] = generate
+    return generate
+
+def hook_motif_factory(name):
+    """
+    For a generator with the "motifs" capability, its module's create_hook_motif(chord_prog, section_type,
+    section_profile, factory_params), which draws the motif generate() keeps in the MelodyContext for a section
+    type. Song plans use it to draw hook motifs up front, so independently rendered sections share them. Else None.
+    """
+    specs = available(); spec = specs.get(name, specs.get(DEFAULT_GENERATOR)) # Same fallback as resolve()
+    if spec is None or "motifs" not in spec.capabilities: return None
+    generate = resolve(name)
+    return getattr(importlib.import_module(generate.__module__), "create_hook_motif", None)
+
+register("Standard", "melody_generators.standard_generator:generate", ("motifs",), "Rule-based phrases developed from a per-section hook motif")
+register("ContourDriven", "melody_generators.contour_generator:generate", ("contours",), "Phrases that follow predefined melodic contour shapes")
+register("MarkovChain", "melody_generators.markov_generator:generate", ("style_files",), "Pitch and rhythm Markov chains loaded from markov_styles/")
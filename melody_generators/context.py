@@ -0,0 +1,56 @@
+# melody_generators/context.py
+from typing import NamedTuple
+
+class MelodyNote(NamedTuple):
+    """ A note relative to the start of its motif or phrase, in beats. """
+    pitch: int
+    time: float
+    duration: float
+
+# Mapping keys generators have always used for the context's attributes.
+_ATTRIBUTE_KEYS = {
+    'rng': 'rng', 'profiler': 'profiler', 'profile_section': 'profile_section',
+    '_get_scale_notes_instance_method': 'get_scale_notes', '_build_chord_voicings_instance_method': 'build_chord_voicings',
+}
+
+class MelodyContext:
+    """
+    What a melody generator sees of the song, built once per composition and passed by reference (the
+    factory_params argument). Reads work like the old params dict: ctx['key'] / ctx.get('key') check the
+    per-song state first, then the factory's live params. Item writes go to `state`, which persists across
+    sections until the next composition pass, so e.g. a chorus hook motif is created once and reused.
+    """
+    __slots__ = ('params', 'rng', 'state', 'profiler', 'profile_section', 'get_scale_notes', 'build_chord_voicings')
+
+    def __init__(self, params, rng, get_scale_notes=None, build_chord_voicings=None, profiler=None):
+        self.params = params
+        self.rng = rng
+        self.state = {}
+        self.profiler = profiler
+        self.profile_section = None
+        self.get_scale_notes = get_scale_notes
+        self.build_chord_voicings = build_chord_voicings
+
+    def __getitem__(self, key):
+        attribute = _ATTRIBUTE_KEYS.get(key)
+        if attribute is not None: return getattr(self, attribute)
+        if key in self.state: return self.state[key]
+        return self.params[key]
+
+    def __setitem__(self, key, value):
+        self.state[key] = value
+
+    def __contains__(self, key):
+        return key in _ATTRIBUTE_KEYS or key in self.state or key in self.params
+
+    def share_hook_motif(self, section_type, motif, reused):
+        """
+        Seeds the state a sequential pass leaves for a hook motif drawn up front (see SongPlan.hook_motifs), so a
+        section rendered on its own develops the song's motif; reused is True for sections after the motif's first.
+        """
+        self.state[f"{section_type}_motif"] = list(motif)
+        if reused: self.state[f"{section_type}_motif_used_once"] = True
+
+    def get(self, key, default=None):
+        try: return self[key]
+        except KeyError: return default
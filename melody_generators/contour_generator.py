@@ -1,5 +1,11 @@
 # melody_generators/contour_generator.py
-import random
+import logging
+from functools import lru_cache
+
+from music_theory import MELODY_CHORD_TONES, melody_scale
+from profiling import profiled_generator
+
+logger = logging.getLogger(__name__)
 
 # --- Contour Shape Definitions ---
 # Values represent relative height/target (0 = low/start, 1 = high/peak of contour range)
@@ -14,40 +20,62 @@ CONTOUR_SHAPES = {
     "WAVE_SIMPLE":    [0.0, 0.7, 1.0, 0.3, 0.0, 0.5, 0.8, 0.2], # 8 steps
     "PLATEAU_HIGH":   [0.2, 0.8, 1.0, 1.0, 1.0, 0.8, 0.2],
     "PLATEAU_LOW":    [0.8, 0.2, 0.0, 0.0, 0.0, 0.2, 0.8],
-    "RANDOM_WALK_ISH":[random.uniform(0.2, 0.8) for _ in range(random.randint(5,9))] # More erratic
+    "RANDOM_WALK_ISH": None # More erratic; drawn per phrase from the composition RNG (see _random_walk_shape)
 }
 
-# Helper: Simplified internal scale/chord functions (ideally from a shared utility or factory_params)
-def get_scale_notes_simple(root, major, style):
-    pentatonic_maj = [0, 2, 4, 7, 9]; pentatonic_min = [0, 3, 5, 7, 10]
-    diatonic_maj = [0, 2, 4, 5, 7, 9, 11]; diatonic_min = [0, 2, 3, 5, 7, 8, 10]
-    if style == 'bridge_distinct' or random.random() < 0.3: return [(root + i) % 12 for i in (diatonic_maj if major else diatonic_min)]
-    else: return [(root + i) % 12 for i in (pentatonic_maj if major else pentatonic_min)]
-
-def get_chord_tones_simple(root, type_str, factory_params): # Pass factory_params for _build_chord_voicings
-    # Use the factory's more robust voicing builder if possible
-    if hasattr(factory_params, '_build_chord_voicings_instance_method'): # Check if method is bound
-        voicings = factory_params._build_chord_voicings_instance_method(root, type_str, octave_center=0, num_notes_pref=4)
-        return [n % 12 for n in voicings]
-    else: # Fallback to very simple
-        root_pc = root % 12; tones = [root_pc]
-        if "major" in type_str or "maj" in type_str : tones.extend([(root_pc + 4) % 12, (root_pc + 7) % 12])
-        elif "minor" in type_str or "min" in type_str: tones.extend([(root_pc + 3) % 12, (root_pc + 7) % 12])
-        else: tones.extend([(root_pc + 4) % 12, (root_pc + 7) % 12])
-        return sorted(list(set(tones)))
+def _random_walk_shape(rng):
+    return [rng.uniform(0.2, 0.8) for _ in range(rng.randint(5,9))]
+
+def get_scale_notes_simple(root, major, style, rng):
+    return melody_scale(root, major, style == 'bridge_distinct' or rng.random() < 0.3)
 
+def get_chord_tones_simple(root, chord_type):
+    return MELODY_CHORD_TONES[chord_type][root % 12]
 
+@lru_cache(maxsize=None)
+def _nearest_pitch_table(chord_tones, scale_pcs):
+    """
+    Snap table for targets 48-84, built once per (chord tones, scale) pair: entry target-48 is (nearest, equidistant).
+    nearest is the first minimum-distance candidate in search order (chord tones before scale tones, each in the
+    target's octave, below, above); equidistant is the pitch at the same distance on the other side of the target,
+    or None. The caller takes equidistant only when it is strictly closer to the previous note.
+    """
+    table = []
+    for target in range(48, 85):
+        octave = target // 12
+        candidates = [(octave + shift) * 12 + pc for pc in chord_tones + scale_pcs for shift in (0, -1, 1)]
+        distance = min(abs(note - target) for note in candidates)
+        nearest = next(note for note in candidates if abs(note - target) == distance)
+        equidistant = 2 * target - nearest
+        table.append((nearest, equidistant if equidistant != nearest and equidistant in candidates else None))
+    return tuple(table)
+
+def _contour_targets(contour, num_notes, center_midi, range_semitones):
+    """ Clamped target pitch per note: the contour interpolated linearly across the phrase, scaled around center_midi. """
+    last_point = len(contour) - 1; targets = []
+    for note_idx in range(num_notes):
+        progress_along_contour = note_idx / (num_notes - 1) if num_notes > 1 else 0.5 # Normalized 0-1
+        contour_point_float = progress_along_contour * last_point
+        idx1 = int(contour_point_float); idx2 = min(idx1 + 1, last_point)
+        interpolated_mult = contour[idx1] + (contour[idx2] - contour[idx1]) * (contour_point_float - idx1)
+        # Multiplier 0 = bottom of range, 1 = top of range; clamp to a reasonable melodic range (C4-C6)
+        targets.append(max(48, min(84, int(round(center_midi + (interpolated_mult - 0.5) * range_semitones)))))
+    return targets
+
+
+@profiled_generator("melody.contour")
 def generate(midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params):
     """
     Generates melody using a contour-driven approach.
     """
-    print(f"    Generating Contour-Driven melody for {section_type}")
+    logger.debug("Generating Contour-Driven melody for %s", section_type, extra={'event': "melody_generate", 'generator': "ContourDriven", 'section_type': section_type})
+    rng = factory_params['rng']
     key_root, is_major = factory_params['active_key_root'], factory_params['active_is_major']
     complexity_str = factory_params['melodic_complexity_level']
     melody_style = section_profile.get('melody_style', 'standard')
     is_hook_section = (section_type == "Chorus" or section_type == "InstrumentalHook")
 
-    base_melody_velocity = section_profile['velocity_base'] + random.randint(5, 10) # Contour melodies can be more expressive
+    base_melody_velocity = section_profile['velocity_base'] + rng.randint(5, 10) # Contour melodies can be more expressive
     if section_profile['is_peak_section']: base_melody_velocity = min(127, base_melody_velocity + 10)
     
     current_abs_beat = start_time_beats
@@ -60,91 +88,54 @@ def generate(midi_obj, track_num, chord_prog, start_time_beats, section_type, se
     for i, (chord_root_midi, chord_type, chord_duration_beats) in enumerate(chord_prog):
         contour_name_options = list(CONTOUR_SHAPES.keys())
         if melody_style == 'bridge_distinct':
-            contour_name = random.choice(["VALLEY_BROAD", "ARCH_BROAD", "DESCENDING_GENTLE", "ASCENDING_GENTLE"])
+            contour_name = rng.choice(["VALLEY_BROAD", "ARCH_BROAD", "DESCENDING_GENTLE", "ASCENDING_GENTLE"])
         elif is_hook_section:
-            contour_name = random.choice(["ARCH_SIMPLE", "WAVE_SIMPLE", "PLATEAU_HIGH"])
+            contour_name = rng.choice(["ARCH_SIMPLE", "WAVE_SIMPLE", "PLATEAU_HIGH"])
         else: # Verse
-            contour_name = random.choice(contour_name_options)
+            contour_name = rng.choice(contour_name_options)
         
         selected_contour_multipliers = CONTOUR_SHAPES[contour_name]
+        if selected_contour_multipliers is None: selected_contour_multipliers = _random_walk_shape(rng)
         
         # Define melodic range for this phrase based on complexity and chord
         phrase_octave = 5
-        if melody_style == 'bridge_distinct' and random.random() < 0.4: phrase_octave = random.choice([4,6])
+        if melody_style == 'bridge_distinct' and rng.random() < 0.4: phrase_octave = rng.choice([4,6])
         
         # Use a central note of the chord as the "0" point of the contour for this phrase
-        phrase_chord_tones = get_chord_tones_simple(chord_root_midi, chord_type, factory_params)
-        phrase_contour_center_pc = random.choice(phrase_chord_tones) if phrase_chord_tones else key_root % 12
+        phrase_chord_tones = get_chord_tones_simple(chord_root_midi, chord_type)
+        phrase_contour_center_pc = rng.choice(phrase_chord_tones) if phrase_chord_tones else key_root % 12
         phrase_contour_center_midi = (phrase_octave * 12) + phrase_contour_center_pc
 
         contour_range_semitones = 7 # Default range (a fifth)
         if complexity_str == "Simple": contour_range_semitones = 5
         elif complexity_str == "Complex": contour_range_semitones = 10
-        if melody_style == 'bridge_distinct': contour_range_semitones = random.randint(7,12)
+        if melody_style == 'bridge_distinct': contour_range_semitones = rng.randint(7,12)
 
 
         # Generate notes for this chord's duration along the contour
-        num_contour_points = len(selected_contour_multipliers)
-        
         # Rhythmic density: how many notes to try and fit
         # More notes for denser rhythms or complex melodies
         num_notes_in_phrase = int(chord_duration_beats * (1.5 + section_profile['rhythmic_density_modifier'] + (0.5 if complexity_str == "Complex" else 0)))
-        if melody_style == 'bridge_distinct': num_notes_in_phrase = int(chord_duration_beats * (0.5 + random.random())) # Fewer notes in bridge
+        if melody_style == 'bridge_distinct': num_notes_in_phrase = int(chord_duration_beats * (0.5 + rng.random())) # Fewer notes in bridge
         num_notes_in_phrase = max(1, num_notes_in_phrase)
 
         beat_step = chord_duration_beats / num_notes_in_phrase if num_notes_in_phrase > 0 else chord_duration_beats
         
-        scale_for_phrase_pc = get_scale_notes_simple(key_root, is_major, melody_style)
+        scale_for_phrase_pc = get_scale_notes_simple(key_root, is_major, melody_style, rng)
+        nearest_pitches = _nearest_pitch_table(phrase_chord_tones, scale_for_phrase_pc)
+        # Targets need no RNG, so the whole phrase is computed up front; the snap/leap/rhythm pass below stays sequential.
+        target_pitches = _contour_targets(selected_contour_multipliers, num_notes_in_phrase, phrase_contour_center_midi, contour_range_semitones)
 
 
         for note_idx in range(num_notes_in_phrase):
             current_note_time_in_phrase = note_idx * beat_step
             
-            # Determine target pitch based on contour progress
-            progress_along_contour = (note_idx / (num_notes_in_phrase -1) if num_notes_in_phrase > 1 else 0.5) # Normalized 0-1
-            contour_point_float = progress_along_contour * (num_contour_points - 1)
-            idx1 = int(contour_point_float)
-            idx2 = min(idx1 + 1, num_contour_points - 1)
-            interp_factor = contour_point_float - idx1
-            
-            mult1 = selected_contour_multipliers[idx1]
-            mult2 = selected_contour_multipliers[idx2]
-            interpolated_mult = mult1 + (mult2 - mult1) * interp_factor # Linear interpolation
-            
-            # Target pitch relative to center, then add center
-            # Multiplier 0 = bottom of range, 1 = top of range
-            target_pitch_offset = (interpolated_mult - 0.5) * contour_range_semitones # -0.5 to 0.5 range for multiplier
-            target_pitch = phrase_contour_center_midi + target_pitch_offset
-            target_pitch = int(round(target_pitch))
-            target_pitch = max(48, min(84, target_pitch)) # Clamp to reasonable melodic range (C4-C6)
-
-            # Select actual note: closest scale/chord tone to target_pitch
-            # Prioritize notes from the current chord, then current scale
-            best_fit_note = target_pitch # Default
-            min_dist = float('inf')
-
-            candidate_pool = []
-            # Strong preference for chord tones
-            for pc_offset in phrase_chord_tones:
-                candidate_pool.append( (target_pitch // 12) * 12 + pc_offset ) # Same octave
-                candidate_pool.append( (target_pitch // 12 - 1) * 12 + pc_offset ) # Octave below
-                candidate_pool.append( (target_pitch // 12 + 1) * 12 + pc_offset ) # Octave above
-            
-            # Then scale tones
-            for pc_offset in scale_for_phrase_pc:
-                candidate_pool.append( (target_pitch // 12) * 12 + pc_offset )
-                candidate_pool.append( (target_pitch // 12 - 1) * 12 + pc_offset )
-                candidate_pool.append( (target_pitch // 12 + 1) * 12 + pc_offset )
-            
-            for note in candidate_pool:
-                if abs(note - target_pitch) < min_dist:
-                    min_dist = abs(note - target_pitch)
-                    best_fit_note = note
-                # If multiple notes are equally close, prefer one that creates a smaller interval from last_generated_pitch
-                elif abs(note - target_pitch) == min_dist and last_generated_pitch is not None:
-                    if abs(note - last_generated_pitch) < abs(best_fit_note - last_generated_pitch):
-                        best_fit_note = note
-            
+            target_pitch = target_pitches[note_idx]
+
+            # Select actual note: closest chord/scale tone to target_pitch; on a tie, the one nearer the previous note
+            best_fit_note, equidistant_note = nearest_pitches[target_pitch - 48]
+            if equidistant_note is not None and last_generated_pitch is not None and abs(equidistant_note - last_generated_pitch) < abs(best_fit_note - last_generated_pitch):
+                best_fit_note = equidistant_note
             actual_pitch = max(48, min(84, best_fit_note)) # Ensure it's in melodic range
 
             # Smoothness constraint for very large leaps, less strict for bridge
@@ -153,14 +144,14 @@ def generate(midi_obj, track_num, chord_prog, start_time_beats, section_type, se
 
             if last_generated_pitch is not None and abs(actual_pitch - last_generated_pitch) > max_leap:
                 direction = 1 if actual_pitch > last_generated_pitch else -1
-                actual_pitch = last_generated_pitch + direction * random.randint(1, min(max_leap, 5))
+                actual_pitch = last_generated_pitch + direction * rng.randint(1, min(max_leap, 5))
                 actual_pitch = max(48, min(84, actual_pitch))
 
 
             note_duration = beat_step
             # Add some rhythmic variation
-            if random.random() < 0.3:
-                note_duration = random.choice([beat_step * 0.5, beat_step * 1.5, beat_step * 0.75])
+            if rng.random() < 0.3:
+                note_duration = rng.choice([beat_step * 0.5, beat_step * 1.5, beat_step * 0.75])
                 note_duration = max(0.125, min(note_duration, chord_duration_beats - current_note_time_in_phrase))
 
 
@@ -0,0 +1,127 @@
+# melody_generators/markov_generator.py
+# Markov-chain melodies: every note draws a duration from a rhythm chain and a scale-step interval from a pitch
+# chain, each conditioned on melodic complexity (the pitch chain also on whether the current note is a chord tone).
+# Styles are JSON files of integer transition weights in markov_styles/; each is compiled once per process into
+# cumulative-weight rows, so a step is one RNG draw plus a bisect.
+import json
+import logging
+import os
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import accumulate
+
+from music_theory import MELODY_CHORD_TONES, melody_scale
+from profiling import profiled_generator
+
+logger = logging.getLogger(__name__)
+
+STYLE_DIR = os.path.join(os.path.dirname(__file__), "markov_styles")
+DEFAULT_STYLE = "default"
+COMPLEXITY_LEVELS = ("Simple", "Moderate", "Complex")
+
+@dataclass(frozen=True)
+class MarkovStyle:
+    name: str
+    intervals: tuple # Scale steps, one per pitch-chain state
+    durations: tuple # Beats, one per rhythm-chain state
+    pitch: dict      # {complexity: (non_chord_tone_rows, chord_tone_rows)}, rows of cumulative weights
+    rhythm: dict     # {complexity: rows of cumulative weights}
+
+def _compile_rows(rows, num_states, where):
+    if len(rows) != num_states or any(len(row) != num_states for row in rows):
+        raise ValueError(f"{where}: expected a {num_states}x{num_states} matrix")
+    if any(weight < 0 for row in rows for weight in row) or any(sum(row) <= 0 for row in rows):
+        raise ValueError(f"{where}: weights must be non-negative with a positive total per row")
+    return tuple(tuple(accumulate(row)) for row in rows)
+
+@lru_cache(maxsize=None)
+def load_style(name_or_path=DEFAULT_STYLE):
+    """ Loads and compiles a style by name (markov_styles/<name>.json) or by path to a .json file. Cached per process. """
+    path = name_or_path if name_or_path.endswith(".json") else os.path.join(STYLE_DIR, f"{name_or_path}.json")
+    with open(path) as f: spec = json.load(f)
+    intervals, durations = tuple(spec['intervals']), tuple(spec['durations'])
+    if 0 not in intervals: raise ValueError(f"{path}: intervals must include 0")
+    pitch = {level: (_compile_rows(spec['pitch'][level]['non_chord_tone'], len(intervals), f"{path} pitch/{level}/non_chord_tone"),
+                     _compile_rows(spec['pitch'][level]['chord_tone'], len(intervals), f"{path} pitch/{level}/chord_tone"))
+             for level in COMPLEXITY_LEVELS}
+    rhythm = {level: _compile_rows(spec['rhythm'][level], len(durations), f"{path} rhythm/{level}") for level in COMPLEXITY_LEVELS}
+    logger.debug("Loaded Markov style %s", spec.get('name', name_or_path), extra={'event': "markov_style_loaded", 'path': path})
+    return MarkovStyle(spec.get('name', name_or_path), intervals, durations, pitch, rhythm)
+
+def _next_state(row, rng):
+    return bisect_right(row, rng.random() * row[-1])
+
+@lru_cache(maxsize=None)
+def _scale_ladder(key_root, is_major):
+    """ Every in-key pitch from 48 to 84, ascending; the pitch chain walks up and down this. """
+    pcs = melody_scale(key_root, is_major, True)
+    return tuple(pitch for pitch in range(48, 85) if pitch % 12 in pcs)
+
+def _nearest_chord_tone(ladder, position, chord_tones):
+    """
+    Ladder index of the chord tone closest to position, breaking ties toward the middle of the range so the
+    line doesn't drift to an edge; position itself if none is within four steps.
+    """
+    toward_middle = 1 if position < len(ladder) // 2 else -1
+    for distance in range(5):
+        for candidate in (position + distance * toward_middle, position - distance * toward_middle):
+            if 0 <= candidate < len(ladder) and ladder[candidate] % 12 in chord_tones: return candidate
+    return position
+
+@profiled_generator("melody.markov")
+def generate(midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params):
+    """
+    Generates melody from the Markov style named by factory_params['markov_style'].
+    Each chord's first note lands on a chord tone; hook sections reuse the first chord's rhythm for the rest of the section.
+    """
+    logger.debug("Generating Markov melody for %s", section_type, extra={'event': "melody_generate", 'generator': "MarkovChain", 'section_type': section_type})
+    rng = factory_params['rng']
+    style = load_style(factory_params.get('markov_style', DEFAULT_STYLE))
+    key_root, is_major = factory_params['active_key_root'], factory_params['active_is_major']
+    complexity_str = factory_params['melodic_complexity_level']
+    melody_style = section_profile.get('melody_style', 'standard')
+    is_hook_section = (section_type == "Chorus" or section_type == "InstrumentalHook")
+    non_chord_rows, chord_rows = style.pitch[complexity_str]
+    rhythm_rows = style.rhythm["Simple" if melody_style == 'bridge_distinct' else complexity_str]
+    rest_probability = 0.2 if section_profile['rhythmic_density_modifier'] < 0.8 else 0.0
+
+    base_melody_velocity = section_profile['velocity_base'] + rng.randint(3, 8)
+    if section_profile['is_peak_section']: base_melody_velocity = min(120, base_melody_velocity + 10)
+    total_section_duration_beats = sum(d for _,_,d in chord_prog)
+
+    ladder = _scale_ladder(key_root % 12, is_major)
+    position = bisect_left(ladder, (5 * 12) + key_root % 12)
+    if melody_style == 'bridge_distinct': position = min(len(ladder) - 1, position + rng.choice([-3, 3]))
+    interval_state = style.intervals.index(0); duration_state = rng.randrange(len(style.durations))
+    hook_rhythm = [] if is_hook_section else None
+
+    current_abs_beat = start_time_beats
+    for i, (chord_root_midi, chord_type, chord_duration_beats) in enumerate(chord_prog):
+        chord_tones = MELODY_CHORD_TONES[chord_type][chord_root_midi % 12]
+        position = _nearest_chord_tone(ladder, position, chord_tones)
+        beat_in_chord = 0.0; note_idx = 0
+        while beat_in_chord < chord_duration_beats - 0.125:
+            if hook_rhythm and i > 0: duration = hook_rhythm[note_idx % len(hook_rhythm)]
+            else:
+                duration_state = _next_state(rhythm_rows[duration_state], rng); duration = style.durations[duration_state]
+                if hook_rhythm is not None and i == 0: hook_rhythm.append(duration)
+            duration = min(duration, chord_duration_beats - beat_in_chord)
+            if note_idx > 0:
+                rows = chord_rows if ladder[position] % 12 in chord_tones else non_chord_rows
+                interval_state = _next_state(rows[interval_state], rng)
+                step = style.intervals[interval_state]
+                position += step if 0 <= position + step < len(ladder) else -step # Reflect off the range edges
+            note_idx += 1
+            if rest_probability and note_idx > 1 and rng.random() < rest_probability:
+                beat_in_chord += duration; continue
+
+            absolute_note_time = current_abs_beat + beat_in_chord
+            progress_within_section = (absolute_note_time - start_time_beats) / total_section_duration_beats if total_section_duration_beats > 0 else 0
+            velocity = base_melody_velocity
+            if section_profile['build_tension']: velocity = min(115, int(base_melody_velocity + (20 * progress_within_section)))
+            elif section_type == "Outro": velocity = int(base_melody_velocity * (1 - progress_within_section * 0.9))
+            if is_hook_section and factory_params['hook_on_downbeat_strong'] and beat_in_chord % 1.0 == 0.0: velocity = min(127, velocity + 10)
+            midi_obj.addNote(track_num, track_num, ladder[position], absolute_note_time, duration * 0.98, velocity)
+            beat_in_chord += duration
+        current_abs_beat += chord_duration_beats
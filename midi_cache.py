@@ -0,0 +1,129 @@
+# midi_cache.py
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import parameter_tables
+
+logger = logging.getLogger(__name__)
+
+def cache_key(generation_params, generator_version):
+    """
+    Stable key for a rendered song: SHA-256 over the canonical JSON of the params, the generator version and the
+    active parameter tables' fingerprint, so neither a generator upgrade nor a tables change serves stale audio.
+    Also used as the HTTP ETag.
+    """
+    canonical = json.dumps({'params': generation_params, 'version': generator_version, 'tables': parameter_tables.fingerprint()},
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class MidiCache:
+    """
+    Two-tier cache of rendered .mid bytes.
+    Memory tier: thread-safe LRU bounded by total bytes. Disk tier (optional): one <key>.mid per entry,
+    consulted on a memory miss and promoted back into memory on a hit. It is bounded by disk_max_bytes: past that,
+    the least recently used files (by mtime, which a disk hit refreshes) are deleted down to 90% of the bound.
+    Disk errors are logged and otherwise ignored; the cache is never why a request fails.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._eviction_lock = threading.Lock()
+        self.hits = 0; self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_size = sum(size for _, _, size in self._disk_entries())
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.mid")
+
+    def _disk_entries(self):
+        """ (mtime, path, size) of every cached file on disk. """
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(".mid"): continue
+            try: stat = entry.stat()
+            except OSError: continue # Evicted by another thread meanwhile
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _write_disk(self, key, midi_bytes):
+        # Write-then-rename so concurrent readers never see a partial file.
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f: f.write(midi_bytes)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            logger.warning("Could not write %s to the disk cache: %s", key, e, extra={'event': "midi_cache_write_failed", 'key': key})
+            if tmp_path is not None:
+                try: os.unlink(tmp_path)
+                except OSError: pass
+            return
+        with self._lock:
+            self._disk_size += len(midi_bytes)
+            over_bound = self._disk_size > self.disk_max_bytes
+        if over_bound: self._evict_disk()
+
+    def _evict_disk(self):
+        if not self._eviction_lock.acquire(blocking=False): return # Another thread is already evicting
+        try:
+            entries = sorted(self._disk_entries())
+            disk_size = sum(size for _, _, size in entries)
+            for _, path, size in entries:
+                if disk_size <= self.disk_max_bytes * 0.9: break
+                try: os.unlink(path)
+                except OSError: continue
+                disk_size -= size
+            with self._lock: self._disk_size = disk_size
+        except OSError as e:
+            logger.warning("Could not evict from the disk cache: %s", e, extra={'event': "midi_cache_evict_failed"})
+        finally:
+            self._eviction_lock.release()
+
+    def _remember(self, key, midi_bytes):
+        # Caller holds the lock.
+        if len(midi_bytes) > self.max_bytes: return
+        previous = self._entries.pop(key, None)
+        if previous is not None: self._size -= len(previous)
+        self._entries[key] = midi_bytes; self._size += len(midi_bytes)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            midi_bytes = self._entries.get(key)
+            if midi_bytes is not None:
+                self._entries.move_to_end(key); self.hits += 1
+                return midi_bytes
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f: midi_bytes = f.read()
+                os.utime(self._disk_path(key)) # Recently used: evicted last
+            except OSError:
+                midi_bytes = None
+            if midi_bytes is not None:
+                with self._lock:
+                    self._remember(key, midi_bytes); self.hits += 1
+                return midi_bytes
+        with self._lock: self.misses += 1
+        return None
+
+    def put(self, key, midi_bytes):
+        with self._lock: self._remember(key, midi_bytes)
+        if self.disk_dir and not os.path.exists(self._disk_path(key)): self._write_disk(key, midi_bytes)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses,
+                    'disk_bytes': self._disk_size if self.disk_dir else None, 'disk_max_bytes': self.disk_max_bytes if self.disk_dir else None}
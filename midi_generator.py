@@ -1,28 +1,122 @@
 # midi_generator.py
+import copy
+import functools
+import json
+import logging
+import os
 import random
-from midiutil import MIDIFile
-
-# Import the new melody generator modules
-from melody_generators import standard_generator 
-from melody_generators import contour_generator 
-# from melody_generators import markov_generator
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from drum_patterns import (BACKBEAT, BACKBEAT_WITH_HATS, CRASH, DEFAULT_KIT, EDM_GROOVE, HAT_STEPS, HIPHOP_GHOST_KICKS, HIPHOP_HAT_STEPS, KITS, RIDE,
+                           fill_pattern, phrase_fills, section_end_fills)
+from midi_cache import cache_key
+from music_theory import SEVENTH_CHORDS, Chord, SORTED_SCALES, ScaleType, degree_chord, voicing
+from note_events import NoteEventBuffer
+import parameter_tables
+from parameter_tables import matches
+from profiling import CompositionProfiler, CountingRandom, measure
+from smf_writer import SmfLimitError, write_smf
+from song_params import ParameterError, SongParams
+from song_plan import RENDER_PARAMS, SectionPlan, SongPlan
+
+# Melody generators are resolved by name through the registry; each module is imported on first use.
+import melody_generators
+from melody_generators import MelodyContext
+
+# Diagnostics go through logging only: per-song events at INFO, per-section/per-layer chatter at DEBUG.
+# Records carry an 'event' attribute plus event-specific fields (see extra=...) for structured handlers.
+logger = logging.getLogger(__name__)
 
 # --- Version ---
-GENERATOR_VERSION = "0.8.6" # Phase 7 - Drum Break Indentation Fix
+GENERATOR_VERSION = "0.9.0" # Songs render in "units" mode by default, so every served song can be archived as its SongPlan
+
+# "native" uses smf_writer; "midiutil" builds a midiutil MIDIFile (imported only when selected). Output bytes are identical.
+MIDI_WRITERS = ("native", "midiutil")
+DEFAULT_MIDI_WRITER = "native"
+RENDER_MODES = ("sequential", "units")
+DEFAULT_RENDER_MODE = "units" # plan() / render_plan() reproduce it; "sequential" gives the pre-0.9 songs
+# (layer, instrument_layers prefixes that enable it), in the order a section renders them.
+LAYERS = (("drums", ("Drums",)), ("bass", ("Bass",)), ("chords", ("Chords",)), ("melody", ("Melody", "CounterMelody")), ("pad", ("Pad",)))
+
+@dataclass(frozen=True)
+class CompositionSummary:
+    """ What compose() produced, returned instead of printed. """
+    title: str
+    seed: int
+    bpm: int
+    key_name: str
+    song_form: tuple
+    sections_rendered: tuple
+    total_beats: float
+    duration_seconds: float
+    note_count: int
+    compose_seconds: float
+
+def song_title_for_seed(seed):
+    return f"UKHitFactory_v{GENERATOR_VERSION}_Seed_{seed}"
+
+def _profiled_layer(layer):
+    """
+    Reports a layer method's wall time, notes emitted and RNG draws to self.profiler.
+    layer is a name or a callable(kwargs) -> name; with no profiler the cost is one None check.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.profiler is None: return method(self, *args, **kwargs)
+            return measure(self.profiler, self.rng, self.notes, self._profile_section, layer(kwargs) if callable(layer) else layer,
+                           method, self, *args, **kwargs)
+        return wrapper
+    return decorate
 
 class UKHitFactory:
-    def __init__(self, user_params):
+    def __init__(self, user_params=None, profiler=None, plan=None, variant=0, unit_cache=None):
+        """
+        Built from user_params (a dict or SongParams), or from a SongPlan to render it; see song_plan.py.
+        In "units" render mode, unit_cache (a song_plan.UnitCache) supplies already-rendered units and keeps new ones.
+        """
+        if isinstance(user_params, SongParams): user_params = user_params.as_dict()
+        if plan is not None: user_params = {'seed': plan.seed}
         self.user_params = user_params
         self.seed = user_params.get('seed', random.randint(0,1000000))
-        random.seed(self.seed)
+        self.song_plan = plan; self.variant = variant # variant != 0 renders units on different substreams
+        self.unit_cache = unit_cache
+        # Each composition owns its RNG so concurrent factories never share draws.
+        # Profiling swaps in a draw-counting RNG that produces the identical sequence.
+        self.profiler = profiler # Collector with record(section_index, section_type, layer, seconds, notes, rng_draws); see profiling.py
+        self.rng = random.Random(self.seed) if profiler is None else CountingRandom(self.seed)
+        self._profile_section = (None, None)
+        self._melody_generate = None # Resolved from the registry on first melody section
+        self._section_blocks = {} # section_reuse: (section_type, bars, key_root, is_major) -> (first_event, stop_event, start_beat, duration_beats)
         
-        self.song_title = f"UKHitFactory_v{GENERATOR_VERSION}_Seed_{self.seed}"
+        self.song_title = song_title_for_seed(self.seed)
         self.num_instrument_tracks = 5
-        self.midi_obj = MIDIFile(numTracks=self.num_instrument_tracks, removeDuplicates=True, deinterleave=False)
+        self.notes = NoteEventBuffer() # Every layer appends here; serialized in one pass by write_midi()
         self.track_map = {"Drums": 0, "Bass": 1, "Chords": 2, "Melody": 3, "Pad": 4}
 
         self.params = {} 
-        self._initialize_and_process_parameters()
+        self.tables = parameter_tables.get_tables() # Loaded once per process; see parameter_tables.py
+        self.total_beats = 0
+        self.sections_rendered = []
+        self.summary = None # CompositionSummary once a full compose() / iter_sections() pass finishes
+        if plan is None: self._initialize_and_process_parameters()
+        else: self._adopt_plan_params(plan)
+        # Shared by every melody section: reads self.params live and keeps per-song generator state (hook motifs).
+        self.melody_context = MelodyContext(self.params, self.rng, self._get_scale_notes, self._build_chord_voicings, profiler)
+
+    def _adopt_plan_params(self, plan):
+        if plan.generator_version != GENERATOR_VERSION:
+            logger.warning("Rendering a plan from generator %s with %s", plan.generator_version, GENERATOR_VERSION,
+                           extra={'event': "plan_version_mismatch", 'plan_version': plan.generator_version})
+        self.params.update(plan.params)
+        self.params.update(active_key_root=plan.params['key_root_original'], active_is_major=plan.params['is_major_original'],
+                           section_reuse=False, render_mode="units", _get_scale_notes_func=self._get_scale_notes,
+                           _build_chord_voicings_func=self._build_chord_voicings)
+        self.params.setdefault('section_variation', 0.0)
 
     def _initialize_and_process_parameters(self):
         self.params['seed'] = self.seed
@@ -31,125 +125,98 @@ class UKHitFactory:
         self.params['primary_genre'] = primary_genre
         self.params['mood'] = mood
 
+        tables = self.tables; rng = self.rng
         tempo_preference = self.user_params.get('tempo_preference', 'Medium')
-        if tempo_preference == "VerySlow": self.params['bpm'] = random.randint(60, 80)
-        elif tempo_preference == "Slow": self.params['bpm'] = random.randint(80, 100)
-        elif tempo_preference == "Medium": self.params['bpm'] = random.randint(100, 120)
-        elif tempo_preference == "Fast": self.params['bpm'] = random.randint(120, 140)
-        elif tempo_preference == "VeryFast": self.params['bpm'] = random.randint(140, 165)
-        else: 
-            if primary_genre == "Ballad": self.params['bpm'] = random.randint(65, 90)
-            elif primary_genre == "HipHopGroove": self.params['bpm'] = random.randint(80, 105)
-            elif primary_genre == "EDMPulse": self.params['bpm'] = random.randint(120, 135)
-            elif primary_genre == "RetroSynthwave": self.params['bpm'] = random.randint(90, 120)
-            else: self.params['bpm'] = random.randint(100, 130)
+        bpm_range = tables['tempo_bpm_ranges'].get(tempo_preference) or tables['genre_bpm_ranges'].get(primary_genre, tables['default_bpm_range'])
+        self.params['bpm'] = rng.randint(*bpm_range)
         if tempo_preference == "Any":
-            energy_level = self.user_params.get('energy_level', 3)
-            if energy_level == 1: self.params['bpm'] = max(60, self.params['bpm'] - 20)
-            elif energy_level == 2: self.params['bpm'] = max(60, self.params['bpm'] - 10)
-            elif energy_level == 4: self.params['bpm'] = min(180, self.params['bpm'] + 10)
-            elif energy_level == 5: self.params['bpm'] = min(180, self.params['bpm'] + 20)
-        for track_num in range(self.midi_obj.numTracks):
-            self.midi_obj.addTempo(track_num, 0, self.params['bpm'])
-        print(f"Selected BPM: {self.params['bpm']}")
+            bpm_offset = tables['energy_bpm_offsets'].get(self.user_params.get('energy_level', 3))
+            if bpm_offset: self.params['bpm'] = max(tables['bpm_limits'][0], min(tables['bpm_limits'][1], self.params['bpm'] + bpm_offset))
 
         song_length_pref = self.user_params.get('song_length', 'Radio')
-        if song_length_pref == "Short": self.params['target_duration_seconds'] = random.randint(120, 150)
-        elif song_length_pref == "Radio": self.params['target_duration_seconds'] = random.randint(150, 195)
-        elif song_length_pref == "Standard": self.params['target_duration_seconds'] = random.randint(195, 240)
-        elif song_length_pref == "Extended": self.params['target_duration_seconds'] = random.randint(240, 285)
-        else: self.params['target_duration_seconds'] = random.randint(150, 195)
-
-        keys_info_major = [(0, "C Major"), (2, "D Major"), (5, "F Major"), (7, "G Major")]
-        keys_info_minor = [(9, "A Minor"), (4, "E Minor"), (2, "D Minor"), (7, "G Minor")]
-        is_major_key = True
-        if mood == "MelancholySentimental": is_major_key = random.random() < 0.1
-        elif mood == "DarkIntense": is_major_key = random.random() < 0.2
-        elif mood == "NeutralReflective": is_major_key = random.random() < 0.5
-        elif mood == "HappyBright": is_major_key = random.random() < 0.9
-        elif mood == "UpliftingEnergetic": is_major_key = random.random() < 0.85
-        if is_major_key: chosen_key_root, chosen_key_name = random.choice(keys_info_major)
-        else: chosen_key_root, chosen_key_name = random.choice(keys_info_minor)
+        self.params['target_duration_seconds'] = rng.randint(*tables['duration_ranges'].get(song_length_pref, tables['default_duration_range']))
+
+        major_probability = tables['major_key_probability'].get(mood)
+        is_major_key = True if major_probability is None else rng.random() < major_probability
+        chosen_key_root, chosen_key_name = rng.choice(tables['major_keys'] if is_major_key else tables['minor_keys'])
         self.params['key_root_original'] = chosen_key_root
         self.params['is_major_original'] = is_major_key
         self.params['key_name_original'] = chosen_key_name
         self.params['active_key_root'] = self.params['key_root_original']
         self.params['active_is_major'] = self.params['is_major_original']
-        print(f"Original Key: {self.params['key_name_original']}")
 
         structural_complexity_pref = self.user_params.get('structural_complexity', 'Standard')
-        if structural_complexity_pref == "Simple":
-            form_templates = [["Intro", "Verse", "Chorus", "Verse", "Chorus", "Outro"], ["Verse", "Chorus", "Verse", "Chorus", "Chorus", "Outro"]]
-        elif structural_complexity_pref == "Developed":
-            form_templates = [["Intro", "Verse", "PreChorus", "Chorus", "Verse", "PreChorus", "Chorus", "Bridge", "InstrumentalHook", "Chorus", "Outro"], ["Intro", "Verse", "PreChorus", "Chorus", "Verse", "PreChorus", "Chorus", "Bridge", "Chorus", "Chorus", "Outro"]]
-        else: # Standard
-            form_templates = [["Intro", "Verse", "PreChorus", "Chorus", "Verse", "PreChorus", "Chorus", "Bridge", "Chorus", "Outro"], ["Intro", "Verse", "Chorus", "Verse", "Chorus", "InstrumentalHook", "Chorus", "Outro"]]
-        self.params['song_form'] = random.choice(form_templates)
-
-        schemas = {"I-V-vi-IV": ([0, 7, 9, 5], "Classic Pop/Rock"), "vi-IV-I-V": ([9, 5, 0, 7], "Singer/Songwriter/Ballad"), "I-vi-IV-V": ([0, 9, 5, 7], "Doo-wop/Oldies"), "IV-V-vi-I": ([5, 7, 9, 0], "Modern Pop/Hopscotch")}
-        schema_choice = "I-V-vi-IV"
-        if mood == "MelancholySentimental" and random.random() < 0.7: schema_choice = "vi-IV-I-V"
-        elif mood == "UpliftingEnergetic" and random.random() < 0.6: schema_choice = "IV-V-vi-I"
-        elif primary_genre == "Ballad": schema_choice = "vi-IV-I-V"
-        elif primary_genre == "RetroSynthwave" and random.random() < 0.5: schema_choice = random.choice(["I-V-vi-IV", "vi-IV-I-V"])
-        else: schema_choice = random.choice(list(schemas.keys()))
+        form_templates = tables['form_templates'].get(structural_complexity_pref) or tables['form_templates'][tables['default_form']]
+        self.params['song_form'] = list(rng.choice(form_templates))
+
+        schemas = tables['schemas']
+        for rule in tables['schema_rules']: # First match wins; a probability only draws once the rule's fields match
+            if not matches(rule['when'], self.params): continue
+            if 'probability' in rule and not rng.random() < rule['probability']: continue
+            schema_choice = rule['schema'] if 'schema' in rule else rng.choice(rule['choose']); break
+        else: schema_choice = rng.choice(tables['schema_names'])
         self.params['harmonic_schema_name'] = schema_choice
-        self.params['harmonic_schema_progression_degrees'], self.params['harmonic_schema_feel'] = schemas[self.params['harmonic_schema_name']]
-        print(f"Harmonic Schema: {self.params['harmonic_schema_name']}")
+        schema_degrees, self.params['harmonic_schema_feel'] = schemas[schema_choice]
+        self.params['harmonic_schema_progression_degrees'] = list(schema_degrees)
 
         harmonic_richness_pref = self.user_params.get('harmonic_richness', 'Some7ths')
-        if harmonic_richness_pref == "TriadsOnly": self.params['use_7th_chords_probability'] = 0.0
-        elif harmonic_richness_pref == "Some7ths": self.params['use_7th_chords_probability'] = 0.4
-        elif harmonic_richness_pref == "Mostly7ths": self.params['use_7th_chords_probability'] = 0.8
-        else: self.params['use_7th_chords_probability'] = 0.4
-
-        if primary_genre == "HipHopGroove": self.params['rhythm_personality'] = "HipHopGroove"
-        elif primary_genre == "EDMPulse": self.params['rhythm_personality'] = "EDMPulse"
-        elif primary_genre == "RetroSynthwave": self.params['rhythm_personality'] = "EDMPulse"
-        elif primary_genre == "Ballad": self.params['rhythm_personality'] = "PopRock"
-        else: self.params['rhythm_personality'] = "PopRock"
-        print(f"Rhythm Personality: {self.params['rhythm_personality']}")
+        self.params['use_7th_chords_probability'] = tables['seventh_chord_probability'].get(harmonic_richness_pref, tables['default_seventh_chord_probability'])
+        self.params['rhythm_personality'] = tables['rhythm_personality'].get(primary_genre, tables['default_rhythm_personality'])
         
         instrumentation_focus = self.user_params.get('instrumentation_focus', 'Balanced')
         self.params['instrumentation_focus'] = instrumentation_focus
 
-        self.params['instruments'] = { "Drums": None }
-        bass_instr = random.choice([33, 34, 38]); chords_instr = random.choice([0, 4, 88]); melody_instr = random.choice([80, 25, 52]); pad_instr = random.choice([89, 90, 92])
-        if self.params['rhythm_personality'] in ["HipHopGroove", "EDMPulse", "RetroSynthwave"]: bass_instr = random.choice([38, 39])
-        if primary_genre == "Ballad": chords_instr = 0; melody_instr = random.choice([25, 40, 52]); pad_instr = random.choice([48, 89])
-        elif primary_genre == "RetroSynthwave": chords_instr = random.choice([80,81,88,89]); melody_instr = random.choice([80,81,84]); pad_instr = random.choice([88,89,90,91,92])
-        if instrumentation_focus == "PianoLed": chords_instr = 0
-        elif instrumentation_focus == "SynthHeavy": chords_instr = random.choice([80,81,88,89]); melody_instr = random.choice([80,81,84]); pad_instr = random.choice([88,89,90,91,92])
-        elif instrumentation_focus == "GuitarFocused": chords_instr = random.choice([24, 25]); melody_instr = random.choice([26, 27, 28, 29, 30])
-        self.params['instruments']['Bass'] = bass_instr; self.params['instruments']['Chords'] = chords_instr; self.params['instruments']['Melody'] = melody_instr; self.params['instruments']['Pad'] = pad_instr
-        if instrumentation_focus == "Minimalist": 
-            self.params['instruments']['Pad'] = None
-            if random.random() < 0.5: self.params['instruments']['Chords'] = None
+        # Defaults are all drawn first, then matching rules override in table order, then drops.
+        instruments = {part: (rng.choice(choices) if isinstance(choices, list) else choices) for part, choices in tables['instrument_defaults'].items()}
+        matching_rules = [rule for rule in tables['instrument_rules'] if matches(rule['when'], self.params)]
+        for rule in matching_rules:
+            for part, choices in rule.get('set', {}).items(): instruments[part] = rng.choice(choices) if isinstance(choices, list) else choices
+        for rule in matching_rules:
+            for part, probability in rule.get('drop', {}).items():
+                if rng.random() < probability: instruments[part] = None
+        self.params['instruments'] = {"Drums": None, **instruments}
         
         energy_level = self.user_params.get('energy_level', 3)
-        if energy_level == 1: self.params['overall_dynamic_level'] = random.randint(55, 65)
-        elif energy_level == 2: self.params['overall_dynamic_level'] = random.randint(65, 75)
-        elif energy_level == 3: self.params['overall_dynamic_level'] = random.randint(75, 85)
-        elif energy_level == 4: self.params['overall_dynamic_level'] = random.randint(85, 95)
-        elif energy_level == 5: self.params['overall_dynamic_level'] = random.randint(95, 105)
-        else: self.params['overall_dynamic_level'] = random.randint(75, 85)
+        self.params['overall_dynamic_level'] = rng.randint(*tables['energy_dynamic_ranges'].get(energy_level, tables['default_dynamic_range']))
 
         melodic_complexity_ui = self.user_params.get('melodic_complexity', 3)
-        if melodic_complexity_ui <= 2: self.params['melodic_complexity_level'] = "Simple"
-        elif melodic_complexity_ui >= 4: self.params['melodic_complexity_level'] = "Complex"
-        else: self.params['melodic_complexity_level'] = "Moderate"
-        print(f"Internal Melodic Complexity: {self.params['melodic_complexity_level']}")
+        self.params['melodic_complexity_level'] = tables['melodic_complexity_levels'][min(5, max(1, melodic_complexity_ui))]
 
         self.params['melody_generation_method'] = self.user_params.get('melody_generation_style', 'Standard')
-        print(f"Melody Generation Method: {self.params['melody_generation_method']}")
+        if 'markov_style' in self.user_params: self.params['markov_style'] = self.user_params['markov_style']
+        # Opt-in: repeats of a section type (same length and key) replay the first occurrence's events, time-shifted,
+        # with an optional velocity variation (0-1) instead of being regenerated.
+        self.params['section_reuse'] = bool(self.user_params.get('section_reuse', False))
+        self.params['section_variation'] = min(1.0, max(0.0, float(self.user_params.get('section_variation', 0.0))))
+        # "units" renders every (section, layer) on its own RNG substream so units can run in parallel; see plan_sections().
+        self.params['render_mode'] = self.user_params.get('render_mode', DEFAULT_RENDER_MODE)
+        if self.params['render_mode'] not in RENDER_MODES: raise ValueError(f"Unknown render mode '{self.params['render_mode']}'; expected one of {RENDER_MODES}")
+        # (section, layer, variation) re-rolls, applied to the plan; see SongPlan.with_rerolls().
+        if self.user_params.get('rerolls'):
+            if self.params['render_mode'] != "units": raise ParameterError('rerolls', "re-rolling a unit is not possible with render_mode=sequential")
+            self.params['rerolls'] = tuple(tuple(reroll) for reroll in self.user_params['rerolls'])
+        logger.debug("Resolved parameters: bpm=%s key=%s schema=%s rhythm=%s melodic_complexity=%s melody_method=%s",
+                     self.params['bpm'], self.params['key_name_original'], self.params['harmonic_schema_name'], self.params['rhythm_personality'],
+                     self.params['melodic_complexity_level'], self.params['melody_generation_method'],
+                     extra={'event': "parameters_resolved", 'seed': self.seed, 'bpm': self.params['bpm'], 'key': self.params['key_name_original'],
+                            'harmonic_schema': self.params['harmonic_schema_name'], 'rhythm_personality': self.params['rhythm_personality'],
+                            'melodic_complexity': self.params['melodic_complexity_level'], 'melody_method': self.params['melody_generation_method']})
 
         self.params['hook_on_downbeat_strong'] = True
         
         self.params['_get_scale_notes_func'] = self._get_scale_notes
         self.params['_build_chord_voicings_func'] = self._build_chord_voicings
 
+    def _choose_layers(self, options, profile):
+        """ First passing option of a section_profiles 'layers' list (see parameter_tables); None if none passes. """
+        for option in options:
+            if 'if' in option and not profile.get(option['if']): continue
+            if 'unless' in option and profile.get(option['unless']): continue
+            if 'probability' in option and not self.rng.random() < option['probability']: continue
+            return list(self.rng.choice(option['choose']) if 'choose' in option else option['layers'])
+        return None
+
     def _get_section_profile(self, section_type, base_dynamic_level):
-        # ... (This method remains the same as v0.8.5)
         profile = {
             'velocity_base': base_dynamic_level, 'rhythmic_density_modifier': 1.0,
             'instrument_layers': ["Chords"], 'fills_enabled': False,
@@ -159,55 +226,33 @@ class UKHitFactory:
         primary_genre = self.params.get('primary_genre', 'ModernPop')
         instrumentation_focus = self.params.get('instrumentation_focus', 'Balanced')
 
-        if primary_genre == "Ballad":
-            profile['rhythmic_density_modifier'] *= 0.7
-            base_dynamic_level = max(50, base_dynamic_level - 10)
-
-        if section_type == "Intro":
-            profile['velocity_base'] = max(40, base_dynamic_level - 35)
-            profile['instrument_layers'] = random.choice([["Chords", "Pad"], ["Melody_Sparse", "Pad"], ["Chords"]])
-            if instrumentation_focus == "Minimalist": profile['instrument_layers'] = [random.choice(["Chords", "Pad", "Melody_Sparse"])]
-            profile['rhythmic_density_modifier'] *= 0.5
-        elif section_type == "Verse":
-            profile['velocity_base'] = max(50, base_dynamic_level - 25)
-            profile['instrument_layers'] = ["Drums_Light", "Bass", "Chords", "Melody"]
-            if random.random() < 0.4 and instrumentation_focus != "Minimalist": profile['instrument_layers'].append("Pad_Light")
-            if instrumentation_focus == "Minimalist": profile['instrument_layers'] = ["Bass", "Melody"]
-            profile['rhythmic_density_modifier'] *= 0.8; profile['fills_enabled'] = True
-        elif section_type == "PreChorus":
-            profile['velocity_base'] = max(55, base_dynamic_level - 20)
-            profile['instrument_layers'] = ["Drums_Build", "Bass_Active", "Chords_Sustained_Cresc", "Melody_Rising", "Pad_Swell_Cresc"]
-            if instrumentation_focus == "Minimalist": profile['instrument_layers'] = ["Drums_Build", "Bass_Active", "Melody_Rising"]
-            profile['rhythmic_density_modifier'] *= 1.2; profile['build_tension'] = True; profile['fills_enabled'] = True
-        elif section_type == "Chorus":
-            profile['velocity_base'] = min(115, base_dynamic_level + 10)
-            profile['instrument_layers'] = ["Drums_Full", "Bass_Driving", "Chords_Full", "Melody_Hook", "Pad_Full"]
-            if random.random() < 0.5 and instrumentation_focus != "Minimalist": profile['instrument_layers'].append("CounterMelody_Simple")
-            if instrumentation_focus == "Minimalist": profile['instrument_layers'] = ["Drums_Full", "Bass_Driving", "Melody_Hook"]
-            profile['fills_enabled'] = True; profile['is_peak_section'] = True
-        elif section_type == "InstrumentalHook":
-            profile['velocity_base'] = min(110, base_dynamic_level + 5)
-            profile['instrument_layers'] = ["Drums_Full", "Bass_Driving", "Chords_Full", "Melody_Hook", "Pad_Full"]
-            if instrumentation_focus == "Minimalist": profile['instrument_layers'] = ["Drums_Full", "Bass_Driving", "Melody_Hook"]
-            profile['fills_enabled'] = True; profile['is_peak_section'] = True; profile['allow_rhythmic_break'] = random.random() < 0.3
-        elif section_type == "Bridge":
-            profile['velocity_base'] = max(45, base_dynamic_level - 30)
-            profile['modulate_key'] = random.random() < 0.5; profile['melody_style'] = 'bridge_distinct'
-            if profile['modulate_key']:
-                profile['instrument_layers'] = ["Drums_Light", "Bass", "Chords_Sustained", "Melody_Modulating", "Pad_Swell"]
-            elif random.random() < 0.6:
-                profile['instrument_layers'] = random.choice([["Chords_Sparse", "Pad"], ["Bass_Melodic", "Pad_Light"], ["Melody_Reflective"]])
-            else:
-                profile['instrument_layers'] = ["Drums_Light", "Bass", "Chords_Sustained", "Melody", "Pad_Swell"]
-            if instrumentation_focus == "Minimalist" and not profile['modulate_key']:
-                 profile['instrument_layers'] = [random.choice(["Melody_Reflective", "Chords_Sparse"])]
-            profile['rhythmic_density_modifier'] *= (0.7 if profile['modulate_key'] else 0.6)
-            profile['allow_rhythmic_break'] = random.random() < 0.2; profile['fills_enabled'] = True
-        elif section_type == "Outro":
-            profile['velocity_base'] = max(35, base_dynamic_level - 40)
-            profile['rhythmic_density_modifier'] *= 0.5
-            profile['instrument_layers'] = random.choice([["Chords_Fade", "Pad_Fade"], ["Melody_Sparse_Fade"], ["Chords_Fade"]])
-            if instrumentation_focus == "Minimalist":  profile['instrument_layers'] = [random.choice(["Melody_Sparse_Fade", "Chords_Fade"])]
+        adjustment = self.tables['genre_section_adjustments'].get(primary_genre)
+        if adjustment:
+            profile['rhythmic_density_modifier'] *= adjustment.get('density', 1.0)
+            base_dynamic_level = max(adjustment.get('dynamic_floor', 0), base_dynamic_level + adjustment.get('dynamic_offset', 0))
+
+        spec = self.tables['section_profiles'].get(section_type)
+        if spec:
+            rng = self.rng
+            for flag, probability in spec['flags']: profile[flag] = rng.random() < probability
+            if spec['velocity']:
+                offset, floor, cap = spec['velocity']; velocity = base_dynamic_level + offset
+                if floor is not None: velocity = max(floor, velocity)
+                if cap is not None: velocity = min(cap, velocity)
+                profile['velocity_base'] = velocity
+            profile.update(spec['static'])
+            layers = self._choose_layers(spec['layers'], profile)
+            if layers is not None: profile['instrument_layers'] = layers
+            for layer, probability in spec['extra_layers']:
+                if rng.random() < probability and instrumentation_focus != "Minimalist": profile['instrument_layers'].append(layer)
+            if instrumentation_focus == "Minimalist":
+                layers = self._choose_layers(spec['minimalist_layers'], profile)
+                if layers is not None: profile['instrument_layers'] = layers
+            density = spec['density']
+            for flag, flag_density in spec['density_if'].items():
+                if profile.get(flag): density = flag_density; break
+            profile['rhythmic_density_modifier'] *= density
+            for flag, probability in spec['late_flags']: profile[flag] = rng.random() < probability
         if instrumentation_focus == "Minimalist":
             has_harmonic_or_melodic = any(s.startswith("Chords") or s.startswith("Melody") for s in profile['instrument_layers'])
             if not has_harmonic_or_melodic:
@@ -216,119 +261,49 @@ class UKHitFactory:
         return profile
 
     def _get_scale_notes(self, root_note, is_major, scale_type="diatonic"):
-        major_intervals = [0, 2, 4, 5, 7, 9, 11]; minor_intervals = [0, 2, 3, 5, 7, 8, 10]
-        major_pentatonic_intervals = [0, 2, 4, 7, 9]; minor_pentatonic_intervals = [0, 3, 5, 7, 10]
-        intervals = []
-        if scale_type == "diatonic": intervals = major_intervals if is_major else minor_intervals
-        elif scale_type == "major_pentatonic": intervals = major_pentatonic_intervals
-        elif scale_type == "minor_pentatonic": intervals = minor_pentatonic_intervals
-        else: intervals = major_intervals if is_major else minor_intervals
-        return sorted([(root_note + i) % 12 for i in intervals])
+        if scale_type == "major_pentatonic": return SORTED_SCALES[ScaleType.MAJOR_PENTATONIC][root_note % 12]
+        if scale_type == "minor_pentatonic": return SORTED_SCALES[ScaleType.MINOR_PENTATONIC][root_note % 12]
+        return SORTED_SCALES[ScaleType.MAJOR if is_major else ScaleType.MINOR][root_note % 12]
 
     def _get_chord_notes_from_roman(self, roman_numeral_degree, key_root, is_major):
-        scale_intervals = [0, 2, 4, 5, 7, 9, 11] if is_major else [0, 2, 3, 5, 7, 8, 10]
-        chord_root_offset = scale_intervals[roman_numeral_degree % 7]
-        actual_chord_root_note = key_root + chord_root_offset; triad_type = "major"
-        if is_major:
-            if roman_numeral_degree in [1, 2, 5]: triad_type = "minor"
-            elif roman_numeral_degree == 6: triad_type = "diminished"
-        else:
-            if roman_numeral_degree in [0, 3, 4]: triad_type = "minor"
-            elif roman_numeral_degree in [2, 5, 6]: triad_type = "major"
-            elif roman_numeral_degree == 1: triad_type = "diminished"
-        final_chord_type = triad_type
-        if self.params.get('use_7th_chords_probability', 0.0) > random.random():
-            if is_major:
-                if roman_numeral_degree in [0, 3]: final_chord_type = "maj7"
-                elif roman_numeral_degree in [1, 2, 5]: final_chord_type = "min7"
-                elif roman_numeral_degree == 4: final_chord_type = "dom7"
-                elif roman_numeral_degree == 6: final_chord_type = "min7b5"
-            else:
-                if roman_numeral_degree in [0,3,4]: final_chord_type = "min7"
-                elif roman_numeral_degree in [2,5]: final_chord_type = "maj7"
-                elif roman_numeral_degree == 1: final_chord_type = "min7b5"
-                elif roman_numeral_degree == 6: final_chord_type = "dom7"
-        return actual_chord_root_note, final_chord_type
+        """ Returns (chord_root, ChordType); the 7th-chord draw happens on every call so the RNG stream never depends on the degree. """
+        use_seventh = self.params.get('use_7th_chords_probability', 0.0) > self.rng.random()
+        return degree_chord(roman_numeral_degree, key_root, is_major, use_seventh)
 
+    @_profiled_layer("chord_progression")
     def _get_chord_progression_for_section(self, section_type, num_bars):
         key_root = self.params['active_key_root']; is_major = self.params['active_is_major']
         schema_degrees = self.params['harmonic_schema_progression_degrees']
         progression_tuples = []; beats_per_chord = 4
-        if section_type == "Bridge" and self.params.get('bridge_is_modulating', False) and random.random() < 0.8:
-            bridge_degrees = random.choice([[1, 4, 0], [3,4,0]])
+        if section_type == "Bridge" and self.params.get('bridge_is_modulating', False) and self.rng.random() < 0.8:
+            bridge_degrees = self.rng.choice([[1, 4, 0], [3,4,0]])
             for bar in range(num_bars):
                 degree = bridge_degrees[bar % len(bridge_degrees)]
                 root_note, chord_type = self._get_chord_notes_from_roman(degree, key_root, is_major)
-                progression_tuples.append((root_note, chord_type, beats_per_chord))
+                progression_tuples.append(Chord(root_note, chord_type, beats_per_chord))
         else:
             for bar in range(num_bars):
                 degree = schema_degrees[bar % len(schema_degrees)]
                 root_note, chord_type = self._get_chord_notes_from_roman(degree, key_root, is_major)
-                progression_tuples.append((root_note, chord_type, beats_per_chord))
+                progression_tuples.append(Chord(root_note, chord_type, beats_per_chord))
         return progression_tuples
 
     def _build_chord_voicings(self, root_midi_note, chord_type, octave_center=4, num_notes_pref=3):
-        root_pc = root_midi_note % 12; notes_pc = [root_pc]
-        if "major" in chord_type or "maj" in chord_type or "dom" in chord_type : notes_pc.extend([(root_pc + 4) % 12, (root_pc + 7) % 12])
-        elif "minor" in chord_type or "min" in chord_type: notes_pc.extend([(root_pc + 3) % 12, (root_pc + 7) % 12])
-        elif "dim" in chord_type: notes_pc.extend([(root_pc + 3) % 12, (root_pc + 6) % 12])
-        else: notes_pc.extend([(root_pc + 4) % 12, (root_pc + 7) % 12])
-        if "maj7" in chord_type: notes_pc.append((root_pc + 11) % 12)
-        elif "min7" in chord_type and "b5" not in chord_type : notes_pc.append((root_pc + 10) % 12)
-        elif "dom7" in chord_type: notes_pc.append((root_pc + 10) % 12)
-        elif "min7b5" in chord_type or ("dim" in chord_type and "7" in chord_type): notes_pc = [root_pc, (root_pc + 3) % 12, (root_pc + 6) % 12, (root_pc + 10) % 12]
-        notes_pc = sorted(list(set(notes_pc)))
-        base_octave_root = root_midi_note
-        if base_octave_root < 36: base_octave_root = (octave_center * 12) + root_pc
-        voiced_notes = [base_octave_root]
-        for interval_note_pc in notes_pc[1:]: voiced_notes.append(base_octave_root + ((interval_note_pc - (base_octave_root % 12) + 12) % 12))
-        if len(voiced_notes) > num_notes_pref and ("7" in chord_type or "b5" in chord_type):
-            if num_notes_pref == 3 and len(voiced_notes) >=3:
-                third_approx = base_octave_root + 3 if "min" in chord_type or "dim" in chord_type else base_octave_root + 4
-                seventh_approx = base_octave_root + 10 if "min7" in chord_type or "dom7" in chord_type or "min7b5" in chord_type else base_octave_root + 11
-                selected_voicing = [base_octave_root]
-                for n in voiced_notes:
-                    if n % 12 == third_approx % 12 and n not in selected_voicing: selected_voicing.append(n); break
-                for n in voiced_notes:
-                    if n % 12 == seventh_approx % 12 and n not in selected_voicing: selected_voicing.append(n); break
-                if len(selected_voicing) < num_notes_pref: voiced_notes = sorted(list(set(voiced_notes)))[:num_notes_pref]
-                else: voiced_notes = sorted(list(set(selected_voicing)))[:num_notes_pref]
-            else: voiced_notes = sorted(list(set(voiced_notes)))[:num_notes_pref]
-        else: voiced_notes = sorted(list(set(voiced_notes)))[:num_notes_pref]
-        return voiced_notes
-
-    def _get_drum_fill_pattern(self, fill_type="standard_snare_roll", rhythm_personality="PopRock"):
-        if fill_type == "standard_snare_roll":
-            return [(38, 1.0, 0.25), (38, 0.75, 0.25), (38, 0.5, 0.25), (38, 0.25, 0.25)]
-        elif fill_type == "tom_roll_simple":
-             return [(48, 1.0, 0.33), (45, 0.66, 0.33), (41, 0.33, 0.33)]
-        elif fill_type == "hiphop_stutter_snare" and rhythm_personality == "HipHopGroove":
-            return [(40, 1.0, 0.125), (22, 0.875, 0.125), (40, 0.75, 0.125), (22, 0.625, 0.125),
-                    (40, 0.5, 0.125), (22, 0.375, 0.125), (40, 0.25, 0.125)]
-        elif fill_type == "edm_noise_sweep" and rhythm_personality == "EDMPulse":
-            return [(46, 1.0, 0.25), (46, 0.75, 0.25), (46, 0.5, 0.25), (46, 0.25, 0.25)]
-        elif fill_type == "kick_and_cymbal_transition":
-            return [(36, 1.0, 0.5), (49, 0.5, 0.5)]
-        elif fill_type == "sparse_tom_accent":
-            return [(45, 0.5, 0.25), (41, 0.25, 0.25)]
-        elif fill_type == "syncopated_snare_pop":
-            return [(38, 1.0, 0.25), (38, 0.5, 0.25)]
-        return [(38, 1.0, 0.25), (38, 0.75, 0.25)]
+        return voicing(root_midi_note, chord_type, octave_center, num_notes_pref)
 
+    @_profiled_layer("drums")
     def _add_drum_pattern(self, track_num, start_time_beats, num_bars, section_type, section_profile):
         base_velocity = section_profile['velocity_base']
         is_build = section_profile['build_tension']; is_peak = section_profile['is_peak_section']
         fills_enabled = section_profile['fills_enabled']; rhythm_personality = self.params['rhythm_personality']
         allow_rhythmic_break = section_profile.get('allow_rhythmic_break', False)
-
-        if rhythm_personality == "HipHopGroove": kick, snare, closed_hh, open_hh = 35, 40, 22, 26
-        elif rhythm_personality == "EDMPulse": kick, snare, closed_hh, open_hh = 36, 38, 42, 46
-        else: kick, snare, closed_hh, open_hh = 36, 38, 42, 46
-        crash, ride = 49, 51
+        is_ballad = self.params['primary_genre'] == "Ballad"
+        kick, snare, closed_hh, open_hh = KITS.get(rhythm_personality, DEFAULT_KIT)
         
-        if self.params['primary_genre'] == "Ballad":
-            if random.random() < 0.4: return
+        if is_ballad:
+            if self.rng.random() < 0.4: return
 
+        notes = self.notes; rng = self.rng
         for bar_idx in range(num_bars):
             bar_start = start_time_beats + bar_idx * 4
             current_bar_overall_velocity = base_velocity
@@ -338,65 +313,57 @@ class UKHitFactory:
                 current_bar_overall_velocity = min(115, current_bar_overall_velocity)
             
             if allow_rhythmic_break and bar_idx == num_bars // 2 and num_bars > 2:
-                if random.random() < 0.5: 
-                    print(f"    Drum break in {section_type} at bar {bar_idx+1}")
-                    if random.random() < 0.7: 
-                        self.midi_obj.addNote(track_num, 9, crash, bar_start, 2, current_bar_overall_velocity -10)
+                if rng.random() < 0.5: 
+                    logger.debug("Drum break in %s at bar %d", section_type, bar_idx + 1, extra={'event': "drum_break", 'section_type': section_type, 'bar': bar_idx + 1})
+                    if rng.random() < 0.7: 
+                        notes.addNote(track_num, 9, CRASH, bar_start, 2, current_bar_overall_velocity -10)
                     continue # Correctly indented to skip the rest of the bar
 
             kick_vel = min(127, current_bar_overall_velocity + 5)
             snare_vel = min(127, current_bar_overall_velocity + 10)
-            hat_vel = max(30, current_bar_overall_velocity - (25 if self.params['primary_genre'] == "Ballad" else 20) )
+            hat_vel = max(30, current_bar_overall_velocity - (25 if is_ballad else 20) )
+            velocities = (kick_vel, snare_vel, hat_vel, current_bar_overall_velocity)
 
             if rhythm_personality == "EDMPulse":
-                for i in range(4): self.midi_obj.addNote(track_num, 9, kick, bar_start + i, 0.5, kick_vel)
-                self.midi_obj.addNote(track_num, 9, snare, bar_start + 1, 0.5, snare_vel)
-                self.midi_obj.addNote(track_num, 9, snare, bar_start + 3, 0.5, snare_vel)
-                for i in range(8):
-                    if i % 2 == 1: self.midi_obj.addNote(track_num, 9, closed_hh, bar_start + i * 0.5, 0.25, hat_vel)
+                notes.addPattern(track_num, 9, bar_start, EDM_GROOVE, velocities)
             elif rhythm_personality == "HipHopGroove":
-                self.midi_obj.addNote(track_num, 9, kick, bar_start + 0, 0.5, kick_vel)
-                if random.random() < 0.6: self.midi_obj.addNote(track_num, 9, kick, bar_start + random.choice([0.75, 1.5, 1.75]), 0.25, current_bar_overall_velocity)
-                self.midi_obj.addNote(track_num, 9, snare, bar_start + 1, 0.5, snare_vel)
-                self.midi_obj.addNote(track_num, 9, kick, bar_start + 2, 0.5, kick_vel if random.random() < 0.7 else current_bar_overall_velocity)
-                if random.random() < 0.4: self.midi_obj.addNote(track_num, 9, kick, bar_start + random.choice([2.5, 2.75, 3.5]), 0.25, current_bar_overall_velocity)
-                self.midi_obj.addNote(track_num, 9, snare, bar_start + 3, 0.5, snare_vel)
-                for i in range(16):
-                    if random.random() < (0.5 if is_build else 0.3):
-                         self.midi_obj.addNote(track_num, 9, closed_hh if random.random() < 0.8 else open_hh, bar_start + i * 0.25, 0.125, hat_vel - random.randint(0,5))
+                notes.addNote(track_num, 9, kick, bar_start + 0, 0.5, kick_vel)
+                if rng.random() < 0.6: notes.addNote(track_num, 9, kick, bar_start + rng.choice(HIPHOP_GHOST_KICKS[0]), 0.25, current_bar_overall_velocity)
+                notes.addNote(track_num, 9, snare, bar_start + 1, 0.5, snare_vel)
+                notes.addNote(track_num, 9, kick, bar_start + 2, 0.5, kick_vel if rng.random() < 0.7 else current_bar_overall_velocity)
+                if rng.random() < 0.4: notes.addNote(track_num, 9, kick, bar_start + rng.choice(HIPHOP_GHOST_KICKS[1]), 0.25, current_bar_overall_velocity)
+                notes.addNote(track_num, 9, snare, bar_start + 3, 0.5, snare_vel)
+                hat_probability = 0.5 if is_build else 0.3
+                for offset in HIPHOP_HAT_STEPS:
+                    if rng.random() < hat_probability:
+                         notes.addNote(track_num, 9, closed_hh if rng.random() < 0.8 else open_hh, bar_start + offset, 0.125, hat_vel - rng.randint(0,5))
             else: 
-                self.midi_obj.addNote(track_num, 9, kick, bar_start + 0, 1, kick_vel)
-                self.midi_obj.addNote(track_num, 9, snare, bar_start + 1, 1, snare_vel)
-                self.midi_obj.addNote(track_num, 9, kick, bar_start + 2, 1, kick_vel)
-                self.midi_obj.addNote(track_num, 9, snare, bar_start + 3, 1, snare_vel)
                 hat_subdivision = 0.5
-                if self.params['primary_genre'] == "Ballad": hat_subdivision = 1.0 
+                if is_ballad: hat_subdivision = 1.0 
                 elif is_build and (bar_idx >= num_bars / 2 if num_bars > 0 else False): hat_subdivision = 0.25
                 elif is_peak or section_profile['rhythmic_density_modifier'] > 1.0 : hat_subdivision = 0.25
-                if hat_subdivision > 0:
-                    for i in range(int(4 / hat_subdivision)):
-                        if self.params['primary_genre'] == "Ballad" and random.random() < 0.6 and section_type == "Verse": continue
-                        hat_note = closed_hh if self.params['primary_genre'] != "Ballad" else random.choice([ride, closed_hh])
-                        if is_build and i % (int(1/hat_subdivision) * 2) == (int(1/hat_subdivision) * 2 -1) and random.random() < 0.3: hat_note = open_hh
-                        self.midi_obj.addNote(track_num, 9, hat_note, bar_start + i * hat_subdivision, hat_subdivision, hat_vel)
-            if is_peak and bar_idx % 4 == 0 : self.midi_obj.addNote(track_num, 9, crash, bar_start, 2, min(127, current_bar_overall_velocity + 15))
-            if fills_enabled and bar_idx == num_bars - 1 and random.random() < 0.85:
-                fill_options = ["standard_snare_roll", "tom_roll_simple", "kick_and_cymbal_transition", "syncopated_snare_pop"]
-                if rhythm_personality == "HipHopGroove": fill_options.append("hiphop_stutter_snare")
-                elif rhythm_personality == "EDMPulse": fill_options.append("edm_noise_sweep")
-                elif self.params['primary_genre'] == "Ballad": fill_options = ["sparse_tom_accent", "kick_and_cymbal_transition"]
-                fill_pattern_name = random.choice(fill_options); fill_notes = self._get_drum_fill_pattern(fill_pattern_name, rhythm_personality)
+                if not is_ballad and not is_build: notes.addPattern(track_num, 9, bar_start, BACKBEAT_WITH_HATS[hat_subdivision], velocities)
+                else:
+                    notes.addPattern(track_num, 9, bar_start, BACKBEAT, velocities)
+                    open_step = int(1/hat_subdivision) * 2
+                    for i, offset in enumerate(HAT_STEPS[hat_subdivision]):
+                        if is_ballad and rng.random() < 0.6 and section_type == "Verse": continue
+                        hat_note = closed_hh if not is_ballad else rng.choice((RIDE, closed_hh))
+                        if is_build and i % open_step == open_step - 1 and rng.random() < 0.3: hat_note = open_hh
+                        notes.addNote(track_num, 9, hat_note, bar_start + offset, hat_subdivision, hat_vel)
+            if is_peak and bar_idx % 4 == 0 : notes.addNote(track_num, 9, CRASH, bar_start, 2, min(127, current_bar_overall_velocity + 15))
+            if fills_enabled and bar_idx == num_bars - 1 and rng.random() < 0.85:
+                fill_notes = fill_pattern(rng.choice(section_end_fills(rhythm_personality, is_ballad)), rhythm_personality)
                 fill_bar_end_time = bar_start + 4; fill_vel = min(127, current_bar_overall_velocity + 10)
-                for note_val, offset_from_end, duration in fill_notes: self.midi_obj.addNote(track_num, 9, note_val, fill_bar_end_time - offset_from_end, duration, fill_vel)
-                if fill_notes: self.midi_obj.addNote(track_num, 9, crash, fill_bar_end_time - 0.01, 0.5, fill_vel + 5)
-            elif fills_enabled and (bar_idx + 1) % 4 == 0 and bar_idx < num_bars -1 and random.random() < (0.15 if self.params['primary_genre'] == "Ballad" else 0.35) :
-                fill_options = ["sparse_tom_accent", "syncopated_snare_pop"]
-                if rhythm_personality != "EDMPulse": fill_options.append("standard_snare_roll")
-                fill_notes = self._get_drum_fill_pattern(random.choice(fill_options), rhythm_personality)
+                for note_val, offset_from_end, duration in fill_notes: notes.addNote(track_num, 9, note_val, fill_bar_end_time - offset_from_end, duration, fill_vel)
+                if fill_notes: notes.addNote(track_num, 9, CRASH, fill_bar_end_time - 0.01, 0.5, fill_vel + 5)
+            elif fills_enabled and (bar_idx + 1) % 4 == 0 and bar_idx < num_bars -1 and rng.random() < (0.15 if is_ballad else 0.35) :
+                fill_notes = fill_pattern(rng.choice(phrase_fills(rhythm_personality)), rhythm_personality)
                 fill_bar_end_time = bar_start + 4; fill_vel = current_bar_overall_velocity
                 for note_val, offset_from_end, duration in fill_notes:
-                    if offset_from_end <= 2.0 : self.midi_obj.addNote(track_num, 9, note_val, fill_bar_end_time - offset_from_end, duration, fill_vel)
+                    if offset_from_end <= 2.0 : notes.addNote(track_num, 9, note_val, fill_bar_end_time - offset_from_end, duration, fill_vel)
 
+    @_profiled_layer("bass")
     def _add_bass_line(self, track_num, chord_prog, start_time_beats, section_type, section_profile):
         base_velocity = section_profile['velocity_base']
         is_build = section_profile['build_tension']; is_peak = section_profile['is_peak_section']
@@ -414,14 +381,14 @@ class UKHitFactory:
                 step_duration = 0.5; num_steps = int(duration_beats / step_duration) if step_duration > 0 else 1
                 for step_idx in range(num_steps):
                     note_to_play = bass_octave_root
-                    if step_idx % 2 == 1 and len(chord_tones_for_bass) > 1 and random.random() < 0.4: note_to_play = chord_tones_for_bass[1] if chord_tones_for_bass[1] < 60 else bass_octave_root
+                    if step_idx % 2 == 1 and len(chord_tones_for_bass) > 1 and self.rng.random() < 0.4: note_to_play = chord_tones_for_bass[1] if chord_tones_for_bass[1] < 60 else bass_octave_root
                     note_velocity = min(127, current_note_overall_velocity + (5 if step_idx % (int(1/step_duration)*2 if step_duration > 0 else 1) == 0 else 0))
-                    self.midi_obj.addNote(track_num, track_num, note_to_play, current_beat + step_idx * step_duration, step_duration - 0.02, note_velocity)
-            elif primary_genre == "Ballad": self.midi_obj.addNote(track_num, track_num, bass_octave_root, current_beat, duration_beats - 0.1, current_note_overall_velocity)
+                    self.notes.addNote(track_num, track_num, note_to_play, current_beat + step_idx * step_duration, step_duration - 0.02, note_velocity)
+            elif primary_genre == "Ballad": self.notes.addNote(track_num, track_num, bass_octave_root, current_beat, duration_beats - 0.1, current_note_overall_velocity)
             else:
                 step_duration = 0.5
                 if rhythm_personality == "EDMPulse" and is_peak: step_duration = 0.25
-                elif rhythm_personality == "HipHopGroove": step_duration = random.choice([0.5, 1.0])
+                elif rhythm_personality == "HipHopGroove": step_duration = self.rng.choice([0.5, 1.0])
                 num_steps = int(duration_beats / step_duration) if step_duration > 0 else 1
                 if num_steps == 0: num_steps = 1
                 last_bass_note_val = None
@@ -431,27 +398,28 @@ class UKHitFactory:
                     if actual_step_duration <= 0.05: continue
                     note_to_play = bass_octave_root; note_velocity = current_note_overall_velocity
                     if step_idx == 0: note_velocity = min(127, current_note_overall_velocity + 5)
-                    if rhythm_personality == "HipHopGroove" and random.random() < 0.4 and step_idx == 0:
+                    if rhythm_personality == "HipHopGroove" and self.rng.random() < 0.4 and step_idx == 0:
                         note_to_play = bass_octave_root - 12 if bass_octave_root >=36 else bass_octave_root
-                        self.midi_obj.addNote(track_num, track_num, note_to_play, beat_in_chord, duration_beats - 0.1, note_velocity); break
+                        self.notes.addNote(track_num, track_num, note_to_play, beat_in_chord, duration_beats - 0.1, note_velocity); break
                     elif step_idx == 0: note_to_play = bass_octave_root
-                    elif random.random() < 0.6:
+                    elif self.rng.random() < 0.6:
                         options = [ct for ct in chord_tones_for_bass if ct >= 24 and ct < 60]
                         if not options: options = [bass_octave_root]
-                        if last_bass_note_val is not None and random.random() < 0.4:
-                            target_chord_tone = random.choice(options); diff = target_chord_tone - last_bass_note_val
+                        if last_bass_note_val is not None and self.rng.random() < 0.4:
+                            target_chord_tone = self.rng.choice(options); diff = target_chord_tone - last_bass_note_val
                             if abs(diff) > 1 and abs(diff) <=4 :
                                 step_dir = 1 if diff > 0 else -1; passing_note_pc = (last_bass_note_val + step_dir) % 12
                                 if passing_note_pc in scale_notes_pc:
                                     possible_passing_notes = [n for n in range(last_bass_note_val + step_dir, target_chord_tone, step_dir) if n%12 == passing_note_pc]
-                                    if possible_passing_notes: note_to_play = random.choice(possible_passing_notes)
-                        else: note_to_play = random.choice(options)
+                                    if possible_passing_notes: note_to_play = self.rng.choice(possible_passing_notes)
+                        else: note_to_play = self.rng.choice(options)
                     if note_to_play < 24: note_to_play += 12
                     if note_to_play > 60 : note_to_play -=12
-                    self.midi_obj.addNote(track_num, track_num, note_to_play, beat_in_chord, actual_step_duration - 0.02, note_velocity)
+                    self.notes.addNote(track_num, track_num, note_to_play, beat_in_chord, actual_step_duration - 0.02, note_velocity)
                     last_bass_note_val = note_to_play
             current_beat += duration_beats
 
+    @_profiled_layer(lambda kwargs: "pad" if kwargs.get('is_pad_role') else "chords")
     def _add_chord_instrument(self, track_num, chord_prog, start_time_beats, num_bars_in_section, section_type, section_profile, is_pad_role=False):
         base_velocity = section_profile['velocity_base'] - (10 if is_pad_role else 0)
         is_build = section_profile['build_tension']; octave_center = 5 if is_pad_role else 4
@@ -464,100 +432,486 @@ class UKHitFactory:
             if is_build: current_note_overall_velocity = int(base_velocity + (20 * progress_within_section)); current_note_overall_velocity = min(100 if is_pad_role else 110, current_note_overall_velocity)
             elif section_type == "Outro": current_note_overall_velocity = int(base_velocity * (1 - progress_within_section * 0.8))
             num_notes_for_voicing = 3
-            if self.params.get('use_7th_chords_probability', 0.0) > random.random() and ("7" in chord_type or "b5" in chord_type): num_notes_for_voicing = random.choice([3,4])
-            if is_pad_role: num_notes_for_voicing = random.choice([2,3,4])
+            if self.params.get('use_7th_chords_probability', 0.0) > self.rng.random() and chord_type in SEVENTH_CHORDS: num_notes_for_voicing = self.rng.choice([3,4])
+            if is_pad_role: num_notes_for_voicing = self.rng.choice([2,3,4])
             chord_pitches = self._build_chord_voicings(root_midi, chord_type, octave_center=octave_center, num_notes_pref=num_notes_for_voicing)
             note_velocity_for_this_chord = current_note_overall_velocity
             if not is_build and not section_type == "Outro": note_velocity_for_this_chord = min(127, current_note_overall_velocity + (3 if is_pad_role else 5) )
             actual_sustain = duration_beats * sustain_factor
-            if is_pad_role and random.random() < 0.5: actual_sustain = duration_beats + 0.1
-            if is_build and not is_pad_role and random.random() < 0.6:
+            if is_pad_role and self.rng.random() < 0.5: actual_sustain = duration_beats + 0.1
+            if is_build and not is_pad_role and self.rng.random() < 0.6:
                 num_pulses = int(duration_beats / 0.5) if duration_beats > 0 else 0
                 for pulse in range(num_pulses):
-                    for pitch in chord_pitches: self.midi_obj.addNote(track_num, track_num, pitch, current_beat + pulse * 0.5, 0.5 * sustain_factor, note_velocity_for_this_chord)
+                    for pitch in chord_pitches: self.notes.addNote(track_num, track_num, pitch, current_beat + pulse * 0.5, 0.5 * sustain_factor, note_velocity_for_this_chord)
             else:
-                for pitch in chord_pitches: self.midi_obj.addNote(track_num, track_num, pitch, current_beat, actual_sustain, note_velocity_for_this_chord)
+                for pitch in chord_pitches: self.notes.addNote(track_num, track_num, pitch, current_beat, actual_sustain, note_velocity_for_this_chord)
             current_beat += duration_beats
             
+    @_profiled_layer("melody")
     def _add_melody_line(self, track_num, chord_prog, start_time_beats, section_type, section_profile):
         method = self.params.get('melody_generation_method', 'Standard')
-        print(f"    Using melody generation method: {method} for {section_type}")
-
-        factory_params_for_melody = self.params.copy()
-        factory_params_for_melody['_get_scale_notes_instance_method'] = self._get_scale_notes
-        factory_params_for_melody['_build_chord_voicings_instance_method'] = self._build_chord_voicings
-        # This provides access to UKHitFactory's instance methods for theory if needed by external generators.
-        # External generators can call: factory_params_for_melody['_get_scale_notes_instance_method'](root, major, style)
-
-        if method == "MarkovChain":
-            print(f"    Markov Chain melody for {section_type} (Not Fully Implemented Yet, using Standard)")
-            standard_generator.generate(self.midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params_for_melody)
-        elif method == "ContourDriven":
-            contour_generator.generate(self.midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params_for_melody)
-        else: # Standard (Rule-Based & Motif)
-            standard_generator.generate(self.midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params_for_melody)
-
-    def _generate_section_midi(self, section_type, current_time_beats, section_bars):
-        print(f"  Generating MIDI for {section_type} ({section_bars} bars)")
+        logger.debug("Using melody generation method %s for %s", method, section_type, extra={'event': "melody_method", 'method': method, 'section_type': section_type})
+
+        # External generators can still call melody_context['_get_scale_notes_instance_method'](root, major, style).
+        self.melody_context.profile_section = self._profile_section
+        if self._melody_generate is None: self._melody_generate = melody_generators.resolve(method)
+        self._melody_generate(self.notes, track_num, chord_prog, start_time_beats, section_type, section_profile, self.melody_context)
+
+    def _vary_events(self, start, stop, amount, rng=None):
+        """ Cheap variation for a replayed section: every velocity in notes[start:stop] moves by up to 12 * amount. """
+        velocity = self.notes.velocity; spread = max(1, int(12 * amount)); width = 2 * spread + 1; random = (rng or self.rng).random
+        for idx in range(start, stop):
+            varied = velocity[idx] + int(random() * width) - spread
+            velocity[idx] = 127 if varied > 127 else (1 if varied < 1 else varied)
+
+    def _start_section(self, section_type, section_bars):
+        """ Draws the section's profile, Bridge modulation and chord progression. A modulated key holds until _finish_section(). """
         section_profile = self._get_section_profile(section_type, self.params['overall_dynamic_level'])
         self.params['bridge_is_modulating'] = False
         if section_type == "Bridge" and section_profile.get('modulate_key', False):
-            self.params['bridge_is_modulating'] = True; modulation_target = random.choice([7, 5])
+            self.params['bridge_is_modulating'] = True; modulation_target = self.rng.choice([7, 5])
             self.params['active_key_root'] = (self.params['key_root_original'] + modulation_target) % 12
             self.params['active_is_major'] = self.params['is_major_original']
-            print(f"    Modulating Bridge to key root {self.params['active_key_root']} ({'Major' if self.params['active_is_major'] else 'Minor'})")
-        chord_prog = self._get_chord_progression_for_section(section_type, section_bars)
-        if any(s.startswith("Drums") for s in section_profile['instrument_layers']): self._add_drum_pattern(self.track_map["Drums"], current_time_beats, section_bars, section_type, section_profile)
-        if any(s.startswith("Bass") for s in section_profile['instrument_layers']): self._add_bass_line(self.track_map["Bass"], chord_prog, current_time_beats, section_type, section_profile)
-        if any(s.startswith("Chords") for s in section_profile['instrument_layers']): self._add_chord_instrument(self.track_map["Chords"], chord_prog, current_time_beats, section_bars, section_type, section_profile, is_pad_role=False)
-        if any(s.startswith("Melody") or s.startswith("CounterMelody") for s in section_profile['instrument_layers']): self._add_melody_line(self.track_map["Melody"], chord_prog, current_time_beats, section_type, section_profile)
-        if any(s.startswith("Pad") for s in section_profile['instrument_layers']): self._add_chord_instrument(self.track_map["Pad"], chord_prog, current_time_beats, section_bars, section_type, section_profile, is_pad_role=True)
+            logger.debug("Modulating Bridge to key root %d", self.params['active_key_root'], extra={'event': "modulation", 'key_root': self.params['active_key_root'], 'is_major': self.params['active_is_major']})
+        return section_profile, self._get_chord_progression_for_section(section_type, section_bars)
+
+    def _finish_section(self, section_type, section_bars):
+        """ Draws the PreChorus pause and reverts a Bridge modulation; returns the section's length in beats. """
         extra_pause_beats = 0
-        if section_type == "PreChorus" and random.random() < 0.7:
-            extra_pause_beats = random.choice([1, 2])
-            if extra_pause_beats > 0: print(f"    Adding {extra_pause_beats} beats of silence after PreChorus.")
+        if section_type == "PreChorus" and self.rng.random() < 0.7:
+            extra_pause_beats = self.rng.choice([1, 2])
+            logger.debug("Adding %d beats of silence after PreChorus", extra_pause_beats, extra={'event': "section_pause", 'beats': extra_pause_beats})
         if self.params.get('bridge_is_modulating', False):
             self.params['active_key_root'] = self.params['key_root_original']
             self.params['active_is_major'] = self.params['is_major_original']
             self.params['bridge_is_modulating'] = False
-            print(f"    Reverted key to original {self.params['key_name_original']} after Bridge.")
+            logger.debug("Reverted key to original %s after Bridge", self.params['key_name_original'], extra={'event': "modulation_revert", 'key': self.params['key_name_original']})
         return section_bars * 4 + extra_pause_beats
 
-    def compose(self):
-        print(f"Composing '{self.song_title}'...")
+    def _section_layers(self, section_profile):
+        """ The LAYERS a section plays, in render order. """
+        instrument_layers = section_profile['instrument_layers']
+        return [layer for layer, prefixes in LAYERS if any(s.startswith(prefixes) for s in instrument_layers)]
+
+    def _render_layer(self, layer, section_type, start_beat, section_bars, section_profile, chord_prog):
+        if layer == "drums": self._add_drum_pattern(self.track_map["Drums"], start_beat, section_bars, section_type, section_profile)
+        elif layer == "bass": self._add_bass_line(self.track_map["Bass"], chord_prog, start_beat, section_type, section_profile)
+        elif layer == "chords": self._add_chord_instrument(self.track_map["Chords"], chord_prog, start_beat, section_bars, section_type, section_profile, is_pad_role=False)
+        elif layer == "melody": self._add_melody_line(self.track_map["Melody"], chord_prog, start_beat, section_type, section_profile)
+        elif layer == "pad": self._add_chord_instrument(self.track_map["Pad"], chord_prog, start_beat, section_bars, section_type, section_profile, is_pad_role=True)
+
+    @_profiled_layer("section")
+    def _generate_section_midi(self, section_type, current_time_beats, section_bars):
+        reuse_key = (section_type, section_bars, self.params['active_key_root'], self.params['active_is_major']) if self.params['section_reuse'] else None
+        block = self._section_blocks.get(reuse_key) if reuse_key else None
+        if block is not None:
+            first_event, stop_event, source_start_beats, duration_beats = block
+            replay_start = len(self.notes)
+            self.notes.copy_range(first_event, stop_event, current_time_beats - source_start_beats)
+            if self.params['section_variation'] > 0: self._vary_events(replay_start, len(self.notes), self.params['section_variation'])
+            logger.debug("Replaying %s from beat %s", section_type, source_start_beats, extra={'event': "section_reused", 'section_type': section_type, 'start_beat': current_time_beats})
+            return duration_beats
+        first_event = len(self.notes)
+        logger.debug("Generating MIDI for %s (%d bars)", section_type, section_bars, extra={'event': "section_start", 'section_type': section_type, 'bars': section_bars, 'start_beat': current_time_beats})
+        section_profile, chord_prog = self._start_section(section_type, section_bars)
+        for layer in self._section_layers(section_profile): self._render_layer(layer, section_type, current_time_beats, section_bars, section_profile, chord_prog)
+        duration_beats = self._finish_section(section_type, section_bars)
+        if reuse_key: self._section_blocks[reuse_key] = (first_event, len(self.notes), current_time_beats, duration_beats)
+        return duration_beats
+
+    def _section_bar_lengths(self):
+        section_bar_lengths = {}
+        structural_complexity_pref = self.user_params.get('structural_complexity', 'Standard')
+        for section_name_in_form in dict.fromkeys(self.params['song_form']): # first-appearance order; set() order varies with PYTHONHASHSEED
+            if section_name_in_form in ["Intro", "Outro"]: section_bar_lengths[section_name_in_form] = self.rng.choice([2,4] if structural_complexity_pref == "Simple" else [4, 8])
+            elif section_name_in_form == "Bridge" or section_name_in_form == "InstrumentalHook": section_bar_lengths[section_name_in_form] = self.rng.choice([4,8])
+            else:
+                if structural_complexity_pref == "Simple": section_bar_lengths[section_name_in_form] = self.rng.choice([8,12])
+                elif structural_complexity_pref == "Developed": section_bar_lengths[section_name_in_form] = self.rng.choice([12,16,20])
+                else: section_bar_lengths[section_name_in_form] = self.rng.choice([8, 12, 16])
+        return section_bar_lengths
+
+    def _begin_composition(self):
+        logger.info("Composing '%s'", self.song_title, extra={'event': "compose_start", 'seed': self.seed})
+        self.sections_rendered = []
         self.params['active_key_root'] = self.params['key_root_original']
         self.params['active_is_major'] = self.params['is_major_original']
-        for key in list(self.params.keys()): 
-            if key.endswith("_motif") or key.endswith("_used_once"): del self.params[key]
-        for track_name, track_num in self.track_map.items():
-            self.midi_obj.addTrackName(track_num, 0, track_name)
-            if track_name != "Drums" and track_name in self.params['instruments'] and self.params['instruments'].get(track_name) is not None:
-                self.midi_obj.addProgramChange(track_num, track_num, 0, self.params['instruments'][track_name])
+        self.melody_context.state.clear() # Hook motifs are per song, shared by every section of this pass
+        self._section_blocks.clear()
+        return time.perf_counter()
+
+    def _complete_composition(self, started, total_beats):
+        self.total_beats = total_beats
+        self.summary = CompositionSummary(
+            title=self.song_title, seed=self.seed, bpm=self.params['bpm'], key_name=self.params['key_name_original'],
+            song_form=tuple(self.params['song_form']), sections_rendered=tuple(self.sections_rendered),
+            total_beats=total_beats, duration_seconds=round(total_beats / self.params['bpm'] * 60, 2),
+            note_count=len(self.notes), compose_seconds=time.perf_counter() - started)
+        logger.info("Composition complete. Total beats: %s, approx duration: %.2fs", total_beats, self.summary.duration_seconds,
+                    extra={'event': "compose_complete", 'seed': self.seed, 'total_beats': total_beats,
+                           'note_count': self.summary.note_count, 'compose_seconds': self.summary.compose_seconds})
+
+    def iter_sections(self, with_notes=True, executor=None):
+        """
+        Composes section by section, yielding each one as soon as its layers are generated:
+        {'index', 'section_type', 'start_beat', 'bars', 'duration_beats', 'event_range', 'notes'}.
+        event_range is the section's (start, stop) slice of self.notes; notes (omitted when with_notes
+        is False) are that slice as (track, channel, pitch, start_beat, duration_beats, velocity) tuples.
+        Stopping iteration early skips the remaining sections entirely.
+        In "units" render mode, executor (optional) renders the units; see _iter_unit_sections().
+        """
+        if self.params['render_mode'] == "units":
+            yield from self._iter_unit_sections(with_notes, executor); return
+        started = self._begin_composition()
         current_total_time_beats = 0
         max_beats = (self.params['target_duration_seconds'] / 60) * self.params['bpm']
-        section_bar_lengths = {}
-        structural_complexity_pref = self.user_params.get('structural_complexity', 'Standard')
-        for section_name_in_form in set(self.params['song_form']):
-            if section_name_in_form in ["Intro", "Outro"]: section_bar_lengths[section_name_in_form] = random.choice([2,4] if structural_complexity_pref == "Simple" else [4, 8])
-            elif section_name_in_form == "Bridge" or section_name_in_form == "InstrumentalHook": section_bar_lengths[section_name_in_form] = random.choice([4,8])
-            else:
-                if structural_complexity_pref == "Simple": section_bar_lengths[section_name_in_form] = random.choice([8,12])
-                elif structural_complexity_pref == "Developed": section_bar_lengths[section_name_in_form] = random.choice([12,16,20])
-                else: section_bar_lengths[section_name_in_form] = random.choice([8, 12, 16])
+        section_bar_lengths = self._section_bar_lengths()
         for i, section_type in enumerate(self.params['song_form']):
-            if current_total_time_beats >= max_beats: print("Max duration reached."); break
+            if current_total_time_beats >= max_beats:
+                logger.debug("Max duration reached before %s", section_type, extra={'event': "max_duration", 'total_beats': current_total_time_beats})
+                break
             section_bars = section_bar_lengths[section_type]
+            first_event = len(self.notes); self._profile_section = (i, section_type)
             duration_beats_of_section = self._generate_section_midi(section_type, current_total_time_beats, section_bars)
+            self.sections_rendered.append(section_type)
+            section = {'index': i, 'section_type': section_type, 'start_beat': current_total_time_beats, 'bars': section_bars,
+                       'duration_beats': duration_beats_of_section, 'event_range': (first_event, len(self.notes))}
+            if with_notes: section['notes'] = self.notes.notes_in_beats(first_event)
+            yield section
             current_total_time_beats += duration_beats_of_section
-        print(f"Composition complete. Total beats: {current_total_time_beats}, Approx duration: {current_total_time_beats / self.params['bpm'] * 60:.2f}s")
-
-    def save_midi(self, filename=None):
+        self._complete_composition(started, current_total_time_beats)
+
+    # --- Unit rendering ---
+    # In "units" render mode the song is planned first (bar lengths, profiles, modulations, progressions and pauses, all
+    # drawn from the song RNG), then every (section, layer) unit is rendered on its own RNG substream seeded with
+    # "seed:section_index:layer" into its own buffer, and the buffers are merged in plan order. Units share no state,
+    # so they can run in any order on any executor and the song is the same for every worker count. Hook motifs, the
+    # one piece of melody state sections share, are drawn while planning (on a "seed:motif:section_type" substream)
+    # and kept in the plan; any other generator state does not carry from one section to the next.
+    def plan_sections(self):
+        """ Draws the song plan's sections (no notes): a SectionPlan per section that fits the target duration. """
+        self.params['active_key_root'] = self.params['key_root_original']
+        self.params['active_is_major'] = self.params['is_major_original']
+        current_total_time_beats = 0
+        max_beats = (self.params['target_duration_seconds'] / 60) * self.params['bpm']
+        section_bar_lengths = self._section_bar_lengths()
+        plan = []; first_of = {}
+        for i, section_type in enumerate(self.params['song_form']):
+            if current_total_time_beats >= max_beats: break
+            section_bars = section_bar_lengths[section_type]; self._profile_section = (i, section_type)
+            key_root, is_major = self.params['active_key_root'], self.params['active_is_major']
+            reuse_key = (section_type, section_bars, key_root, is_major) if self.params['section_reuse'] else None
+            if reuse_key in first_of:
+                source = first_of[reuse_key]
+                section = SectionPlan(i, section_type, current_total_time_beats, section_bars, source.duration_beats, key_root, is_major, reuse_of=source.index)
+            else:
+                section_profile, chord_prog = self._start_section(section_type, section_bars)
+                section_key = (self.params['active_key_root'], self.params['active_is_major'], self.params['bridge_is_modulating'])
+                section = SectionPlan(i, section_type, current_total_time_beats, section_bars, self._finish_section(section_type, section_bars),
+                                      *section_key, tuple(self._section_layers(section_profile)), section_profile, tuple(chord_prog))
+                if reuse_key: first_of[reuse_key] = section
+            plan.append(section)
+            current_total_time_beats += section.duration_beats
+        return plan
+
+    def plan(self):
+        """
+        Runs only the planning stage and returns its SongPlan; render_plan() of it equals compose(). Raises ValueError in
+        "sequential" render mode, whose songs are not built from a plan.
+        """
+        # Planning draws from the song RNG, so it runs once per factory and later calls return the same plan.
+        if self.song_plan is not None: return self.song_plan
+        if self.params['render_mode'] != "units": raise ValueError("Only render_mode='units' songs have a SongPlan")
+        sections = tuple(self.plan_sections())
+        plan = SongPlan(GENERATOR_VERSION, {key: self.params[key] for key in RENDER_PARAMS if key in self.params}, sections, self._plan_hook_motifs(sections))
+        self.song_plan = plan.with_rerolls(self.params['rerolls']) if self.params.get('rerolls') else plan
+        return self.song_plan
+
+    def _plan_hook_motifs(self, sections):
+        """ SongPlan.hook_motifs: each section type's motif, drawn on its own substream for its first melody section that takes one. """
+        create_hook_motif = melody_generators.hook_motif_factory(self.params.get('melody_generation_method', 'Standard'))
+        if create_hook_motif is None: return ()
+        hook_motifs = {}
+        for section in sections:
+            if section.reuse_of is not None or "melody" not in section.layers or section.section_type in hook_motifs: continue
+            rng = self._substream_rng(f"motif:{section.section_type}")
+            context = MelodyContext(dict(self.params, active_key_root=section.key_root, active_is_major=section.is_major), rng,
+                                    self._get_scale_notes, self._build_chord_voicings, self.profiler)
+            motif = create_hook_motif(section.chord_prog, section.section_type, section.profile, context)
+            if motif: hook_motifs[section.section_type] = (section.index, tuple(motif))
+        return tuple((section_type, first_index, motif) for section_type, (first_index, motif) in hook_motifs.items())
+
+    def _substream_rng(self, substream):
+        substream_seed = f"{self.seed}:{substream}"
+        return random.Random(substream_seed) if self.profiler is None else CountingRandom(substream_seed)
+
+    def _unit_rng(self, section_index, layer, variant=None):
+        variant = self.variant if variant is None else variant
+        return self._substream_rng(f"{section_index}:{layer}" + (f":v{variant}" if variant else ""))
+
+    def render_unit(self, section, layer, variant=None):
+        """ Renders one (SectionPlan, layer) unit into a new NoteEventBuffer, without touching this factory's state. """
+        unit = copy.copy(self)
+        # Methods patched onto this instance are bound to it and would write into its buffer with its RNG.
+        for name in [name for name in vars(unit) if callable(getattr(type(unit), name, None))]: delattr(unit, name)
+        unit.rng = self._unit_rng(section.index, layer, variant); unit.notes = NoteEventBuffer()
+        unit.params = dict(self.params, active_key_root=section.key_root, active_is_major=section.is_major, bridge_is_modulating=section.bridge_is_modulating)
+        unit.melody_context = MelodyContext(unit.params, unit.rng, self._get_scale_notes, self._build_chord_voicings, self.profiler)
+        hook_motif = self.song_plan.hook_motif(section) if layer == "melody" and self.song_plan is not None else None
+        if hook_motif is not None: unit.melody_context.share_hook_motif(section.section_type, *hook_motif)
+        unit._profile_section = (section.index, section.section_type)
+        unit._render_layer(layer, section.section_type, section.start_beat, section.bars, section.profile, section.chord_prog)
+        return unit.notes
+
+    def _iter_unit_sections(self, with_notes, executor):
+        """
+        Plans the song (or takes the SongPlan this factory was built from), then renders its units: one at a time as
+        sections are consumed when executor is None, otherwise all up front on the executor (threads or processes;
+        a process executor gets chunks of units per task). Units in self.unit_cache are reused, not rendered, unless a
+        profiler is attached: then every unit is rendered and profiled, on the executor too, so no layer timing is missing.
+        """
+        started = self._begin_composition()
+        plan = self.plan()
+        # A cached unit was timed by whoever rendered it first, so profiling renders every unit to report the whole song.
+        unit_cache = self.unit_cache if self.profiler is None else None
+        fingerprint = plan.fingerprint() if unit_cache is not None else None
+        def unit_key(section_index, layer): return (fingerprint, section_index, layer, plan.unit_variant(section_index, layer, self.variant))
+        rendered = {}
+        if unit_cache is not None:
+            for section in plan.sections:
+                for layer in section.layers:
+                    notes = unit_cache.get(unit_key(section.index, layer))
+                    if notes is not None: rendered[(section.index, layer)] = notes
+        if executor is not None:
+            missing = [(section.index, layer) for section in plan.sections for layer in section.layers if (section.index, layer) not in rendered]
+            if missing: rendered.update(_render_planned_units(plan, self.variant, executor, missing, profiler=self.profiler))
+        event_ranges = {}
+        for section in plan.sections:
+            first_event = len(self.notes)
+            if section.reuse_of is not None:
+                source_start, source_stop = event_ranges[section.reuse_of]
+                self.notes.copy_range(source_start, source_stop, section.start_beat - plan.sections[section.reuse_of].start_beat)
+                if self.params['section_variation'] > 0:
+                    self._vary_events(first_event, len(self.notes), self.params['section_variation'], self._unit_rng(section.index, "variation"))
+            else:
+                for layer in section.layers:
+                    notes = rendered.get((section.index, layer))
+                    if notes is None: notes = self.render_unit(section, layer, plan.unit_variant(section.index, layer, self.variant))
+                    if unit_cache is not None: unit_cache.put(unit_key(section.index, layer), notes)
+                    self.notes.extend(notes)
+            event_ranges[section.index] = (first_event, len(self.notes))
+            self.sections_rendered.append(section.section_type)
+            yielded = {'index': section.index, 'section_type': section.section_type, 'start_beat': section.start_beat, 'bars': section.bars,
+                       'duration_beats': section.duration_beats, 'event_range': event_ranges[section.index]}
+            if with_notes: yielded['notes'] = self.notes.notes_in_beats(first_event)
+            yield yielded
+        self._complete_composition(started, plan.total_beats)
+
+    def compose(self, executor=None):
+        """ Composes the whole song and returns its CompositionSummary. executor only applies in "units" render mode. """
+        for _ in self.iter_sections(with_notes=False, executor=executor): pass
+        return self.summary
+
+    def _program_changes(self):
+        return {track_num: self.params['instruments'][track_name] for track_name, track_num in self.track_map.items()
+                if track_name != "Drums" and self.params['instruments'].get(track_name) is not None}
+
+    def _build_midi_file(self):
+        from midiutil import MIDIFile
+        midi_file = MIDIFile(numTracks=self.num_instrument_tracks, removeDuplicates=False, deinterleave=False) # NoteEventBuffer already dedups
+        midi_file.addTempo(0, 0, self.params['bpm'])
+        programs = self._program_changes()
+        for track_name, track_num in self.track_map.items():
+            midi_file.addTrackName(track_num, 0, track_name)
+            if track_num in programs: midi_file.addProgramChange(track_num, track_num, 0, programs[track_num])
+        self.notes.write_to_midifile(midi_file)
+        return midi_file
+
+    @property
+    def midi_obj(self):
+        """ A fresh midiutil MIDIFile holding the composed song (kept for callers that used the old attribute). """
+        return self._build_midi_file()
+
+    def write_midi(self, file_handle, writer=None):
+        """ Serializes the song. The native writer hands songs past its limits to midiutil, which writes the same bytes. """
+        writer = writer or DEFAULT_MIDI_WRITER
+        if writer not in MIDI_WRITERS: raise ValueError(f"Unknown MIDI writer '{writer}'; expected one of {MIDI_WRITERS}")
+        if writer == "native":
+            track_names = {track_num: track_name for track_name, track_num in self.track_map.items()}
+            try:
+                write_smf(file_handle, self.notes, self.params['bpm'], track_names, self._program_changes(), self.num_instrument_tracks)
+                return
+            except SmfLimitError as e:
+                logger.info("%s; writing with midiutil", e, extra={'event': "midi_writer_fallback", 'seed': self.seed, 'note_count': len(self.notes)})
+        self._build_midi_file().writeFile(file_handle)
+
+    def save_midi(self, filename=None, writer=None):
         if filename is None: filename = f"{self.song_title.replace(' ', '_')}.mid"
         with open(filename, "wb") as output_file:
-            self.midi_obj.writeFile(output_file)
-        print(f"MIDI file saved as {filename}")
+            self.write_midi(output_file, writer=writer)
+        logger.info("MIDI file saved as %s", filename, extra={'event': "midi_saved", 'path': filename})
+
+# --- Unit Rendering Workers ---
+def _render_unit_chunk(plan, variant, units, profile=False):
+    """ Worker: renders each (section_index, layer) of a SongPlan; returns them with their LayerRecords when profiling. """
+    profiler = CompositionProfiler() if profile else None
+    hit_generator = UKHitFactory(plan=plan, variant=variant, profiler=profiler)
+    rendered = [((section_index, layer), hit_generator.render_unit(plan.sections[section_index], layer, plan.unit_variant(section_index, layer, variant)))
+                for section_index, layer in units]
+    return rendered, profiler.records if profiler is not None else ()
+
+def _render_planned_units(plan, variant, executor, units=None, tasks=None, profiler=None):
+    """
+    Renders the (section_index, layer) units of plan (default: all of them) on executor, as up to tasks submissions
+    (default 2 per CPU) of round-robin chunks so long and short sections spread evenly. Returns {(section_index, layer): NoteEventBuffer}.
+    With a profiler, workers profile their units and the records are replayed into it.
+    """
+    if units is None: units = [(section.index, layer) for section in plan.sections for layer in section.layers]
+    tasks = max(1, min(len(units), tasks or 2 * (os.cpu_count() or 1)))
+    futures = [executor.submit(_render_unit_chunk, plan, variant, units[offset::tasks], profiler is not None) for offset in range(tasks)]
+    rendered = {}
+    for future in futures:
+        chunk, records = future.result()
+        rendered.update(chunk)
+        for record in records: profiler.record(record.section_index, record.section_type, record.layer, record.seconds, record.notes, record.rng_draws)
+    return rendered
+
+# --- Batch Composition ---
+def _seed_entry(param_template, seed):
+    """ (user_params, manifest entry) for one seed of a batch. """
+    user_params = dict(param_template); user_params['seed'] = seed
+    return user_params, {'seed': seed, 'params_key': cache_key(user_params, GENERATOR_VERSION)}
+
+def _render_seed_chunk(param_template, seeds, output_dir):
+    """ Worker: composes and saves one chunk of seeds, capturing failures per seed. """
+    results = []
+    for seed in seeds:
+        user_params, entry = _seed_entry(param_template, seed)
+        started = time.perf_counter()
+        try:
+            hit_generator = UKHitFactory(user_params=user_params)
+            summary = hit_generator.compose()
+            filename = os.path.join(output_dir, f"{hit_generator.song_title.replace(' ', '_')}.mid")
+            hit_generator.save_midi(filename)
+            entry.update(status="ok", file=os.path.basename(filename), bpm=summary.bpm, key=summary.key_name,
+                         song_form=list(summary.song_form), note_count=summary.note_count)
+        except Exception as e:
+            logger.warning("Seed %s failed: %s", seed, e, extra={'event': "batch_seed_failed", 'seed': seed})
+            entry.update(status="error", error=f"{type(e).__name__}: {e}")
+        entry['seconds'] = round(time.perf_counter() - started, 4)
+        results.append(entry)
+    return results
+
+def compose_batch(param_template, seeds, output_dir, max_workers=None, chunk_size=8, max_in_flight=None, manifest_name="manifest.jsonl"):
+    """
+    Composes one song per seed across a process pool, writing each .mid into output_dir and one JSON line per
+    seed to the manifest as chunks finish (a manifest from an earlier run is replaced).
+    A failing seed is recorded in the manifest and never stops the batch. When a worker process dies, the pool is
+    restarted and the seeds it was running are retried one at a time, so only a seed that crashes again is failed.
+    Returns a summary dict with counts and the manifest path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or max_workers * 2 # Bounds queued chunks (and their results) held in memory
+    seeds = iter(seeds)
+    manifest_path = os.path.join(output_dir, manifest_name)
+    summary = {'ok': 0, 'failed': 0, 'manifest': manifest_path}
+    started = time.perf_counter()
+
+    def next_chunk():
+        chunk = []
+        for seed in seeds:
+            chunk.append(seed)
+            if len(chunk) >= chunk_size: break
+        return chunk
+
+    def record(entries):
+        for entry in entries:
+            summary['ok' if entry['status'] == "ok" else 'failed'] += 1
+            manifest.write(json.dumps(entry) + "\n")
+
+    def collect(futures):
+        """ Records finished chunks; returns True when the pool broke under one of them. """
+        broken = False
+        for future in futures:
+            chunk, isolated = in_flight.pop(future)
+            try: record(future.result())
+            except BrokenProcessPool as e:
+                broken = True
+                if not isolated: suspects.extend(chunk); continue
+                logger.warning("Seed %s crashed its worker: %s", chunk[0], e, extra={'event': "batch_seed_failed", 'seed': chunk[0]})
+                record([dict(_seed_entry(param_template, chunk[0])[1], status="error", error=f"{type(e).__name__}: {e}", seconds=None)])
+        return broken
+
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    in_flight = {} # future -> (seeds, isolated)
+    suspects = deque() # Seeds that were running when a worker died
+    exhausted = False
+    try:
+        with open(manifest_path, "w") as manifest:
+            while in_flight or suspects or not exhausted:
+                if suspects:
+                    # Retried alone, so a pool that breaks again can only have been broken by this seed.
+                    if not in_flight:
+                        seed = suspects.popleft()
+                        in_flight[executor.submit(_render_seed_chunk, param_template, [seed], output_dir)] = ([seed], True)
+                else:
+                    while not exhausted and len(in_flight) < max_in_flight:
+                        chunk = next_chunk()
+                        if not chunk: exhausted = True; break
+                        in_flight[executor.submit(_render_seed_chunk, param_template, chunk, output_dir)] = (chunk, False)
+                if not in_flight: break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                if collect(done):
+                    collect(wait(in_flight)[0]) # Every other chunk of the dead pool finishes or breaks too
+                    logger.warning("A batch worker died; restarting the pool", extra={'event': "batch_pool_restarted", 'suspects': len(suspects)})
+                    executor.shutdown(wait=True); executor = ProcessPoolExecutor(max_workers=max_workers)
+                manifest.flush()
+    finally:
+        executor.shutdown(wait=True)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+def _parse_seeds(seeds_arg, seed_range_arg):
+    """ Raises ValueError for a malformed --seeds or --seed-range. """
+    if seed_range_arg:
+        start, stop = (int(v) for v in seed_range_arg.split(":"))
+        return range(start, stop)
+    return [int(v) for v in seeds_arg.split(",") if v.strip()]
+
+def batch_main(argv=None):
+    """ CLI entry point for compose_batch. """
+    import argparse
+    parser = argparse.ArgumentParser(description="Compose a batch of songs, one per seed, across a process pool.")
+    parser.add_argument("output_dir", help="Directory for .mid files and the manifest")
+    seed_group = parser.add_mutually_exclusive_group(required=True)
+    seed_group.add_argument("--seeds", help="Comma-separated seed list, e.g. 1,2,3")
+    seed_group.add_argument("--seed-range", help="Half-open seed range START:STOP, e.g. 0:1000")
+    parser.add_argument("--params", help="JSON file with the parameter template (any 'seed' key is ignored)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Seeds per submitted work item")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Maximum submitted chunks awaiting results")
+    parser.add_argument("--log-level", default="WARNING", help="Logging level, e.g. INFO or DEBUG (default: WARNING)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s %(name)s: %(message)s")
+
+    param_template = {}
+    if args.params:
+        with open(args.params) as f: param_template = json.load(f)
+    param_template.pop('seed', None)
+    try: param_template = SongParams.from_mapping(param_template).as_dict()
+    except ParameterError as e: parser.error(f"--params: {e}")
+    try: seeds = _parse_seeds(args.seeds, args.seed_range)
+    except ValueError:
+        parser.error(f"--seed-range: expected START:STOP, got {args.seed_range!r}" if args.seed_range else f"--seeds: expected comma-separated integers, got {args.seeds!r}")
+    summary = compose_batch(param_template, seeds, args.output_dir,
+                            max_workers=args.workers, chunk_size=args.chunk_size, max_in_flight=args.max_in_flight)
+    print(f"Batch complete: {summary['ok']} ok, {summary['failed']} failed in {summary['seconds']}s. Manifest: {summary['manifest']}")
+    return 1 if summary['failed'] else 0
 
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1: sys.exit(batch_main(sys.argv[1:]))
     test_user_params = {
         'seed': random.randint(0,1000000), 
         'primary_genre': 'ModernPop', 
@@ -571,7 +925,8 @@ if __name__ == "__main__":
         'instrumentation_focus': 'Balanced',
         'melody_generation_style': 'ContourDriven'
     }
-    print(f"Using test_user_params for local test: {test_user_params}")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger.info("Using test_user_params for local test: %s", test_user_params)
     hit_generator = UKHitFactory(user_params=test_user_params)
-    hit_generator.compose()
+    print(hit_generator.compose())
     hit_generator.save_midi()
\ No newline at end of file
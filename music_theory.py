@@ -0,0 +1,99 @@
+# music_theory.py
+"""
+Scale, chord-tone and voicing tables shared by UKHitFactory and the melody generators.
+Everything is built once at import; lookups return interned tuples and allocate nothing.
+"""
+from enum import IntEnum
+from typing import NamedTuple
+
+class ChordType(IntEnum):
+    MAJOR = 0
+    MINOR = 1
+    DIMINISHED = 2
+    MAJ7 = 3
+    MIN7 = 4
+    DOM7 = 5
+    MIN7B5 = 6
+
+class Chord(NamedTuple):
+    """ One chord of a progression: root as a MIDI note number (or pitch class), ChordType, length in beats. """
+    root: int
+    chord_type: ChordType
+    beats: float
+
+SEVENTH_CHORDS = frozenset((ChordType.MAJ7, ChordType.MIN7, ChordType.DOM7, ChordType.MIN7B5))
+
+class ScaleType(IntEnum):
+    MAJOR = 0
+    MINOR = 1
+    MAJOR_PENTATONIC = 2
+    MINOR_PENTATONIC = 3
+
+SCALE_INTERVALS = {
+    ScaleType.MAJOR: (0, 2, 4, 5, 7, 9, 11), ScaleType.MINOR: (0, 2, 3, 5, 7, 8, 10),
+    ScaleType.MAJOR_PENTATONIC: (0, 2, 4, 7, 9), ScaleType.MINOR_PENTATONIC: (0, 3, 5, 7, 10),
+}
+# SCALES[scale_type][root_pc]: pitch classes in interval order. Generators rng.choice() from these, so order is part of the output.
+SCALES = tuple(tuple(tuple((root + i) % 12 for i in SCALE_INTERVALS[scale_type]) for root in range(12)) for scale_type in ScaleType)
+SORTED_SCALES = tuple(tuple(tuple(sorted(pcs)) for pcs in by_root) for by_root in SCALES)
+
+# Chord spellings as semitones above the root. Diminished triads are spelled (0, 3, 7): the original string matcher
+# read "diminished" as containing "min", and existing seeds must keep rendering the same songs.
+CHORD_INTERVALS = {
+    ChordType.MAJOR: (0, 4, 7), ChordType.MINOR: (0, 3, 7), ChordType.DIMINISHED: (0, 3, 7),
+    ChordType.MAJ7: (0, 4, 7, 11), ChordType.MIN7: (0, 3, 7, 10), ChordType.DOM7: (0, 4, 7, 10), ChordType.MIN7B5: (0, 3, 6, 10),
+}
+# (third, seventh) kept when a seventh chord is thinned to three notes.
+GUIDE_TONES = {ChordType.MAJ7: (4, 11), ChordType.MIN7: (3, 10), ChordType.DOM7: (4, 10), ChordType.MIN7B5: (3, 10)}
+# Triad the melody generators target for each chord type (the 7th is left to the harmony instruments).
+_MELODY_TRIAD = {
+    ChordType.MAJOR: (0, 4, 7), ChordType.MINOR: (0, 3, 7), ChordType.DIMINISHED: (0, 3, 7),
+    ChordType.MAJ7: (0, 4, 7), ChordType.MIN7: (0, 3, 7), ChordType.DOM7: (0, 4, 7), ChordType.MIN7B5: (0, 3, 7),
+}
+# MELODY_CHORD_TONES[chord_type][root_pc]: sorted pitch classes.
+MELODY_CHORD_TONES = tuple(tuple(tuple(sorted({(root + i) % 12 for i in _MELODY_TRIAD[chord_type]})) for root in range(12)) for chord_type in ChordType)
+
+# Diatonic chord quality per scale degree. Degrees outside 0-6 (schemas store semitone offsets such as 7 and 9)
+# resolve to a major triad that never takes a seventh.
+DEGREE_TRIADS = {
+    True: {1: ChordType.MINOR, 2: ChordType.MINOR, 5: ChordType.MINOR, 6: ChordType.DIMINISHED},
+    False: {0: ChordType.MINOR, 3: ChordType.MINOR, 4: ChordType.MINOR, 2: ChordType.MAJOR, 5: ChordType.MAJOR, 6: ChordType.MAJOR, 1: ChordType.DIMINISHED},
+}
+DEGREE_SEVENTHS = {
+    True: {0: ChordType.MAJ7, 3: ChordType.MAJ7, 1: ChordType.MIN7, 2: ChordType.MIN7, 5: ChordType.MIN7, 4: ChordType.DOM7, 6: ChordType.MIN7B5},
+    False: {0: ChordType.MIN7, 3: ChordType.MIN7, 4: ChordType.MIN7, 2: ChordType.MAJ7, 5: ChordType.MAJ7, 1: ChordType.MIN7B5, 6: ChordType.DOM7},
+}
+
+def degree_chord(degree, key_root, is_major, seventh):
+    """ (chord_root, ChordType) for a scale degree; seventh selects the diatonic seventh chord where one exists. """
+    root = key_root + SCALE_INTERVALS[ScaleType.MAJOR if is_major else ScaleType.MINOR][degree % 7]
+    triad = DEGREE_TRIADS[is_major].get(degree, ChordType.MAJOR)
+    return root, (DEGREE_SEVENTHS[is_major].get(degree, triad) if seventh else triad)
+
+def _voice(base, chord_type, num_notes):
+    """ Close-position voicing above base (whose pitch class is the root), thinned to num_notes. """
+    root_pc = base % 12
+    pcs = sorted({(root_pc + i) % 12 for i in CHORD_INTERVALS[chord_type]})
+    # Stacking from the lowest pitch class rather than the root drops a tone for some roots; kept for seed stability.
+    voiced = [base] + [base + (pc - root_pc) % 12 for pc in pcs[1:]]
+    if len(voiced) > num_notes and chord_type in SEVENTH_CHORDS and num_notes == 3:
+        selected = [base]
+        for interval in GUIDE_TONES[chord_type]:
+            for note in voiced:
+                if note % 12 == (base + interval) % 12 and note not in selected: selected.append(note); break
+        if len(selected) >= num_notes: voiced = selected
+    return tuple(sorted(set(voiced))[:num_notes])
+
+MAX_VOICING_NOTES = 4
+# VOICINGS[chord_type][num_notes][base_midi_note]
+VOICINGS = tuple(tuple(tuple(_voice(base, chord_type, num_notes) for base in range(128)) for num_notes in range(MAX_VOICING_NOTES + 1)) for chord_type in ChordType)
+
+def voicing(root_midi_note, chord_type, octave_center=4, num_notes=3):
+    """ Roots below C2 (36) are placed at octave_center; anything off the table is built on demand. """
+    base = root_midi_note if root_midi_note >= 36 else (octave_center * 12) + root_midi_note % 12
+    if base < 128 and num_notes <= MAX_VOICING_NOTES: return VOICINGS[chord_type][num_notes][base]
+    return _voice(base, chord_type, num_notes)
+
+def melody_scale(key_root, is_major, diatonic):
+    """ Diatonic or pentatonic pitch classes of the key, in interval order. """
+    return SCALES[(ScaleType.MAJOR if is_major else ScaleType.MINOR) if diatonic else (ScaleType.MAJOR_PENTATONIC if is_major else ScaleType.MINOR_PENTATONIC)][key_root % 12]
@@ -0,0 +1,88 @@
+# note_events.py
+from array import array
+from itertools import repeat
+
+# Matches midiutil's default resolution so tick rounding is identical on either serializer.
+TICKS_PER_QUARTERNOTE = 960
+
+class NoteEventBuffer:
+    """
+    Compact, column-oriented store for note events.
+    Exposes the same addNote(track, channel, pitch, time, duration, volume) call as
+    midiutil's MIDIFile, so generators can write into it unchanged; times are converted
+    to integer ticks on the way in and nothing else is allocated per note.
+    """
+    __slots__ = ('track', 'channel', 'pitch', 'start', 'duration', 'velocity')
+
+    def __init__(self):
+        self.track = array('B'); self.channel = array('B'); self.pitch = array('B')
+        self.start = array('q'); self.duration = array('q'); self.velocity = array('B')
+
+    def __len__(self):
+        return len(self.start)
+
+    def addNote(self, track, channel, pitch, time, duration, volume):
+        self.track.append(track); self.channel.append(channel); self.pitch.append(pitch)
+        self.start.append(int(time * TICKS_PER_QUARTERNOTE)); self.duration.append(int(duration * TICKS_PER_QUARTERNOTE))
+        self.velocity.append(127 if volume > 127 else (0 if volume < 0 else int(volume))) # Data bytes above 127 would corrupt the stream
+
+    def addPattern(self, track, channel, time, pattern, velocities):
+        """ Appends a precompiled pattern (drum_patterns.DrumPattern) starting at time; its velocity slots index into velocities. """
+        count = len(pattern.offsets); origin = int(time * TICKS_PER_QUARTERNOTE)
+        clamped = [127 if volume > 127 else (0 if volume < 0 else int(volume)) for volume in velocities]
+        self.track.extend(repeat(track, count)); self.channel.extend(repeat(channel, count)); self.pitch.extend(pattern.pitches)
+        self.start.extend([origin + offset for offset in pattern.offsets]); self.duration.extend(pattern.durations)
+        self.velocity.extend([clamped[slot] for slot in pattern.velocity_slots])
+
+    def extend(self, other):
+        """ Appends every event of another NoteEventBuffer, in its insertion order. """
+        self.track.extend(other.track); self.channel.extend(other.channel); self.pitch.extend(other.pitch)
+        self.start.extend(other.start); self.duration.extend(other.duration); self.velocity.extend(other.velocity)
+
+    def copy_range(self, start, stop, time_shift):
+        """ Appends a copy of events [start:stop), moved time_shift beats later. """
+        shift = int(time_shift * TICKS_PER_QUARTERNOTE)
+        self.track.extend(self.track[start:stop]); self.channel.extend(self.channel[start:stop]); self.pitch.extend(self.pitch[start:stop])
+        self.start.extend([begin + shift for begin in self.start[start:stop]]); self.duration.extend(self.duration[start:stop])
+        self.velocity.extend(self.velocity[start:stop])
+
+    def notes_in_beats(self, start=0, stop=None):
+        """ Returns events [start:stop) in insertion order as (track, channel, pitch, start_beat, duration_beats, velocity). """
+        tpq = TICKS_PER_QUARTERNOTE
+        return [(track, channel, pitch, begin / tpq, duration / tpq, velocity) for track, channel, pitch, begin, duration, velocity in
+                zip(self.track[start:stop], self.channel[start:stop], self.pitch[start:stop], self.start[start:stop], self.duration[start:stop], self.velocity[start:stop])]
+
+    def deduplicated_indices(self):
+        """
+        Returns (note_on_indices, note_off_indices): buffer indices whose note-on / note-off survive dedup.
+        Mirrors midiutil's removeDuplicates: a note-on is a duplicate of an earlier note-on with the same
+        track/channel/pitch/tick (likewise for note-offs), and the first inserted event wins.
+        """
+        # Packed integer keys: tick above 4 bits track, 4 bits channel, 7 bits pitch.
+        voices = [(track << 11) | (channel << 7) | pitch for track, channel, pitch in zip(self.track, self.channel, self.pitch)]
+        on_keys = [(start << 15) | voice for start, voice in zip(self.start, voices)]
+        off_keys = [((start + duration) << 15) | voice for start, duration, voice in zip(self.start, self.duration, voices)]
+        # Building the dict from the reversed sequence leaves each key mapped to its first index.
+        backwards = range(len(voices) - 1, -1, -1)
+        note_ons = dict(zip(reversed(on_keys), backwards)).values()
+        note_offs = dict(zip(reversed(off_keys), backwards)).values()
+        return note_ons, note_offs
+
+    def write_to_midifile(self, midi_file):
+        """
+        Bulk-loads the deduplicated events into a midiutil MIDIFile (created with removeDuplicates=False),
+        bypassing its per-note addNote path and its object-hashing dedup pass.
+        """
+        from midiutil.MidiFile import NoteOff, NoteOn
+        track_offset = 1 if midi_file.header.numeric_format == 1 else 0 # Format 1 reserves track 0 for tempo
+        base_order = midi_file.event_counter
+        note_ons, note_offs = self.deduplicated_indices()
+        track, channel, pitch, start, duration, velocity = self.track, self.channel, self.pitch, self.start, self.duration, self.velocity
+        tracks = midi_file.tracks
+        for idx in note_ons:
+            tracks[track[idx] + track_offset].eventList.append(
+                NoteOn(channel[idx], pitch[idx], start[idx], duration[idx], velocity[idx], insertion_order=base_order + idx))
+        for idx in note_offs:
+            tracks[track[idx] + track_offset].eventList.append(
+                NoteOff(channel[idx], pitch[idx], start[idx] + duration[idx], velocity[idx], insertion_order=base_order + idx))
+        midi_file.event_counter += len(self)
@@ -0,0 +1,184 @@
+# parameter_tables.py
+"""
+Data tables UKHitFactory resolves song parameters and section profiles from. The built-in tables are below;
+a JSON file with the same layout (named by the UKHITFACTORY_TABLES env var, or passed to configure()) is merged
+over them, so genres, moods and section types can be added or retuned without touching the generator.
+
+Conventions the resolver relies on:
+- A range is [low, high] for rng.randint.
+- In instrument and layer tables a list means rng.choice, anything else is a fixed value.
+- Rule lists are ordered. A rule matches when every 'when' field equals the song's value (or is in a listed set).
+  One with a 'probability' then costs one rng.random() draw. Table order is draw order, so reordering entries
+  changes what existing seeds render.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+
+TABLES_ENV_VAR = "UKHITFACTORY_TABLES"
+
+DEFAULT_TABLES = {
+    'genres': ["ModernPop", "PopRock", "EDMPulse", "HipHopGroove", "Ballad", "RetroSynthwave"],
+    'moods': ["UpliftingEnergetic", "HappyBright", "NeutralReflective", "MelancholySentimental", "DarkIntense"],
+
+    # BPM: tempo preference first; any other preference ("Any") falls back to the genre's range, then energy shifts it.
+    'tempo_bpm_ranges': {"VerySlow": [60, 80], "Slow": [80, 100], "Medium": [100, 120], "Fast": [120, 140], "VeryFast": [140, 165]},
+    'genre_bpm_ranges': {"Ballad": [65, 90], "HipHopGroove": [80, 105], "EDMPulse": [120, 135], "RetroSynthwave": [90, 120]},
+    'default_bpm_range': [100, 130],
+    'energy_bpm_offsets': {1: -20, 2: -10, 4: 10, 5: 20}, # Only when tempo_preference is "Any"
+    'bpm_limits': [60, 180],
+
+    'duration_ranges': {"Short": [120, 150], "Radio": [150, 195], "Standard": [195, 240], "Extended": [240, 285]},
+    'default_duration_range': [150, 195],
+
+    # Moods not listed are always major, without a draw.
+    'major_key_probability': {"MelancholySentimental": 0.1, "DarkIntense": 0.2, "NeutralReflective": 0.5, "HappyBright": 0.9, "UpliftingEnergetic": 0.85},
+    'major_keys': [[0, "C Major"], [2, "D Major"], [5, "F Major"], [7, "G Major"]],
+    'minor_keys': [[9, "A Minor"], [4, "E Minor"], [2, "D Minor"], [7, "G Minor"]],
+
+    'form_templates': {
+        "Simple": [["Intro", "Verse", "Chorus", "Verse", "Chorus", "Outro"], ["Verse", "Chorus", "Verse", "Chorus", "Chorus", "Outro"]],
+        "Standard": [["Intro", "Verse", "PreChorus", "Chorus", "Verse", "PreChorus", "Chorus", "Bridge", "Chorus", "Outro"],
+                     ["Intro", "Verse", "Chorus", "Verse", "Chorus", "InstrumentalHook", "Chorus", "Outro"]],
+        "Developed": [["Intro", "Verse", "PreChorus", "Chorus", "Verse", "PreChorus", "Chorus", "Bridge", "InstrumentalHook", "Chorus", "Outro"],
+                      ["Intro", "Verse", "PreChorus", "Chorus", "Verse", "PreChorus", "Chorus", "Bridge", "Chorus", "Chorus", "Outro"]],
+    },
+    'default_form': "Standard",
+
+    # Harmonic schemas: name -> [scale degrees in semitones, feel]. The first matching rule picks one ('schema') or
+    # draws from a list ('choose'); if none matches, every schema is drawn from in table order.
+    'schemas': {"I-V-vi-IV": [[0, 7, 9, 5], "Classic Pop/Rock"], "vi-IV-I-V": [[9, 5, 0, 7], "Singer/Songwriter/Ballad"],
+                "I-vi-IV-V": [[0, 9, 5, 7], "Doo-wop/Oldies"], "IV-V-vi-I": [[5, 7, 9, 0], "Modern Pop/Hopscotch"]},
+    'schema_rules': [
+        {'when': {'mood': "MelancholySentimental"}, 'probability': 0.7, 'schema': "vi-IV-I-V"},
+        {'when': {'mood': "UpliftingEnergetic"}, 'probability': 0.6, 'schema': "IV-V-vi-I"},
+        {'when': {'primary_genre': "Ballad"}, 'schema': "vi-IV-I-V"},
+        {'when': {'primary_genre': "RetroSynthwave"}, 'probability': 0.5, 'choose': ["I-V-vi-IV", "vi-IV-I-V"]},
+    ],
+
+    'seventh_chord_probability': {"TriadsOnly": 0.0, "Some7ths": 0.4, "Mostly7ths": 0.8},
+    'default_seventh_chord_probability': 0.4,
+
+    'rhythm_personality': {"HipHopGroove": "HipHopGroove", "EDMPulse": "EDMPulse", "RetroSynthwave": "EDMPulse"},
+    'default_rhythm_personality': "PopRock",
+
+    # Instruments: defaults drawn Bass, Chords, Melody, Pad; then every matching rule overrides in order
+    # (None removes the part); then 'drop' rules remove a part with the given probability.
+    'instrument_defaults': {"Bass": [33, 34, 38], "Chords": [0, 4, 88], "Melody": [80, 25, 52], "Pad": [89, 90, 92]},
+    'instrument_rules': [
+        {'when': {'rhythm_personality': ["HipHopGroove", "EDMPulse", "RetroSynthwave"]}, 'set': {"Bass": [38, 39]}},
+        {'when': {'primary_genre': "Ballad"}, 'set': {"Chords": 0, "Melody": [25, 40, 52], "Pad": [48, 89]}},
+        {'when': {'primary_genre': "RetroSynthwave"}, 'set': {"Chords": [80, 81, 88, 89], "Melody": [80, 81, 84], "Pad": [88, 89, 90, 91, 92]}},
+        {'when': {'instrumentation_focus': "PianoLed"}, 'set': {"Chords": 0}},
+        {'when': {'instrumentation_focus': "SynthHeavy"}, 'set': {"Chords": [80, 81, 88, 89], "Melody": [80, 81, 84], "Pad": [88, 89, 90, 91, 92]}},
+        {'when': {'instrumentation_focus': "GuitarFocused"}, 'set': {"Chords": [24, 25], "Melody": [26, 27, 28, 29, 30]}},
+        {'when': {'instrumentation_focus': "Minimalist"}, 'set': {"Pad": None}, 'drop': {"Chords": 0.5}},
+    ],
+
+    'energy_dynamic_ranges': {1: [55, 65], 2: [65, 75], 3: [75, 85], 4: [85, 95], 5: [95, 105]},
+    'default_dynamic_range': [75, 85],
+    'melodic_complexity_levels': {1: "Simple", 2: "Simple", 3: "Moderate", 4: "Complex", 5: "Complex"}, # Out-of-range values clamp to 1-5
+
+    # Per-genre adjustment applied before every section profile: density factor, and dynamic level offset with a floor.
+    'genre_section_adjustments': {"Ballad": {'density': 0.7, 'dynamic_offset': -10, 'dynamic_floor': 50}},
+    # Section profiles. Resolved in this order, each step drawing only where noted:
+    #   flags        [name, probability] pairs, one draw each
+    #   velocity     [offset from the dynamic level, floor or null, cap or null]
+    #   layers       options; the first whose 'if'/'unless' flag and 'probability' (one draw) pass gives 'layers' or 'choose' (one draw)
+    #   extra_layers [layer, probability] pairs, one draw each; appended unless the focus is Minimalist
+    #   minimalist_layers  options as for layers, used instead when the focus is Minimalist
+    #   density      factor, or density_if {flag: factor} when that flag is set
+    #   late_flags   as flags, drawn last
+    'section_profiles': {
+        "Intro": {'velocity': [-35, 40, None], 'layers': [{'choose': [["Chords", "Pad"], ["Melody_Sparse", "Pad"], ["Chords"]]}],
+                  'minimalist_layers': [{'choose': [["Chords"], ["Pad"], ["Melody_Sparse"]]}], 'density': 0.5},
+        "Verse": {'velocity': [-25, 50, None], 'layers': [{'layers': ["Drums_Light", "Bass", "Chords", "Melody"]}], 'extra_layers': [["Pad_Light", 0.4]],
+                  'minimalist_layers': [{'layers': ["Bass", "Melody"]}], 'density': 0.8, 'fills_enabled': True},
+        "PreChorus": {'velocity': [-20, 55, None], 'layers': [{'layers': ["Drums_Build", "Bass_Active", "Chords_Sustained_Cresc", "Melody_Rising", "Pad_Swell_Cresc"]}],
+                      'minimalist_layers': [{'layers': ["Drums_Build", "Bass_Active", "Melody_Rising"]}], 'density': 1.2, 'build_tension': True, 'fills_enabled': True},
+        "Chorus": {'velocity': [10, None, 115], 'layers': [{'layers': ["Drums_Full", "Bass_Driving", "Chords_Full", "Melody_Hook", "Pad_Full"]}],
+                   'extra_layers': [["CounterMelody_Simple", 0.5]], 'minimalist_layers': [{'layers': ["Drums_Full", "Bass_Driving", "Melody_Hook"]}],
+                   'fills_enabled': True, 'is_peak_section': True},
+        "InstrumentalHook": {'velocity': [5, None, 110], 'layers': [{'layers': ["Drums_Full", "Bass_Driving", "Chords_Full", "Melody_Hook", "Pad_Full"]}],
+                             'minimalist_layers': [{'layers': ["Drums_Full", "Bass_Driving", "Melody_Hook"]}],
+                             'fills_enabled': True, 'is_peak_section': True, 'late_flags': [["allow_rhythmic_break", 0.3]]},
+        "Bridge": {'flags': [["modulate_key", 0.5]], 'velocity': [-30, 45, None], 'melody_style': "bridge_distinct",
+                   'layers': [{'if': "modulate_key", 'layers': ["Drums_Light", "Bass", "Chords_Sustained", "Melody_Modulating", "Pad_Swell"]},
+                              {'probability': 0.6, 'choose': [["Chords_Sparse", "Pad"], ["Bass_Melodic", "Pad_Light"], ["Melody_Reflective"]]},
+                              {'layers': ["Drums_Light", "Bass", "Chords_Sustained", "Melody", "Pad_Swell"]}],
+                   'minimalist_layers': [{'unless': "modulate_key", 'choose': [["Melody_Reflective"], ["Chords_Sparse"]]}],
+                   'density': 0.6, 'density_if': {"modulate_key": 0.7}, 'late_flags': [["allow_rhythmic_break", 0.2]], 'fills_enabled': True},
+        "Outro": {'velocity': [-40, 35, None], 'density': 0.5, 'layers': [{'choose': [["Chords_Fade", "Pad_Fade"], ["Melody_Sparse_Fade"], ["Chords_Fade"]]}],
+                  'minimalist_layers': [{'choose': [["Melody_Sparse_Fade"], ["Chords_Fade"]]}]},
+    },
+}
+# Tables keyed by integer levels; JSON object keys arrive as strings.
+_INT_KEYED = ('energy_bpm_offsets', 'energy_dynamic_ranges', 'melodic_complexity_levels')
+
+def merge_tables(base, overrides):
+    """ Returns base with overrides applied: nested dicts merge key by key, anything else (lists included) replaces. """
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if key in _INT_KEYED and isinstance(value, dict): value = {int(level): entry for level, entry in value.items()}
+        if isinstance(value, dict) and isinstance(merged.get(key), dict) and key not in ('when', 'set'):
+            merged[key] = merge_tables(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+def load_tables(path):
+    """ The built-in tables with the JSON file at path merged over them. """
+    with open(path) as f: overrides = json.load(f)
+    if not isinstance(overrides, dict): raise ValueError(f"{path}: expected a JSON object of tables")
+    return merge_tables(DEFAULT_TABLES, overrides)
+
+_SECTION_STATIC = ('fills_enabled', 'build_tension', 'is_peak_section', 'melody_style')
+
+def _normalize_section(spec):
+    """ Fills in every optional key so profile resolution is plain indexing. """
+    return {'flags': [tuple(flag) for flag in spec.get('flags', ())], 'velocity': spec.get('velocity'),
+            'static': {key: spec[key] for key in _SECTION_STATIC if key in spec}, 'layers': spec.get('layers', []),
+            'extra_layers': [tuple(extra) for extra in spec.get('extra_layers', ())], 'minimalist_layers': spec.get('minimalist_layers', []),
+            'density': spec.get('density', 1.0), 'density_if': spec.get('density_if', {}), 'late_flags': [tuple(flag) for flag in spec.get('late_flags', ())]}
+
+def compile_tables(tables):
+    """ A copy of tables with section profiles normalized for resolution; what get_tables() hands to UKHitFactory. """
+    compiled = dict(tables)
+    compiled['section_profiles'] = {section_type: _normalize_section(spec) for section_type, spec in tables['section_profiles'].items()}
+    compiled['schema_names'] = list(tables['schemas'])
+    compiled['fingerprint'] = hashlib.sha256(json.dumps(tables, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+    return compiled
+
+_active = None
+_lock = threading.Lock()
+
+def get_tables():
+    """ The tables in effect: configure()'s, else the UKHITFACTORY_TABLES file's, else the built-ins. Loaded once per process. """
+    global _active
+    if _active is None:
+        with _lock:
+            if _active is None:
+                path = os.environ.get(TABLES_ENV_VAR)
+                _active = compile_tables(load_tables(path) if path else DEFAULT_TABLES)
+    return _active
+
+def fingerprint():
+    """ SHA-256 of the active tables' canonical JSON: changes whenever a tables change can change what a seed renders. """
+    return get_tables()['fingerprint']
+
+def configure(path=None):
+    """
+    Switches every later UKHitFactory in this process to the tables at path (None restores the built-ins).
+    Worker processes (compose_batch, GenerationPool) only see tables named by UKHITFACTORY_TABLES.
+    """
+    global _active
+    with _lock: _active = compile_tables(load_tables(path) if path else DEFAULT_TABLES)
+
+def matches(when, values):
+    """ True when every field in a rule's 'when' equals values[field], or is one of them if the rule lists several. """
+    for field, expected in when.items():
+        actual = values.get(field)
+        if actual != expected and (type(expected) is not list or actual not in expected): return False
+    return True
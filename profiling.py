@@ -0,0 +1,93 @@
+# profiling.py
+import functools
+import random
+import time
+from dataclasses import dataclass
+
+# Layer names reported by UKHitFactory. "section" spans a whole _generate_section_midi call; "melody.standard" /
+# "melody.contour" are nested inside "melody" (the generator body without dispatch), so don't sum across levels.
+# "chord_progression" is drawn per section before any layer plays (while planning, in "units" render mode).
+TOP_LEVEL_LAYERS = ("drums", "bass", "chords", "melody", "pad")
+
+class CountingRandom(random.Random):
+    """
+    random.Random that counts underlying draws. Overriding both random() and getrandbits() keeps the
+    base class on its getrandbits-based _randbelow, so a seeded CountingRandom yields exactly the same
+    sequence as random.Random: profiling never changes the song.
+    """
+    def __init__(self, seed=None):
+        self.draws = 0
+        super().__init__(seed)
+
+    def random(self):
+        self.draws += 1
+        return super().random()
+
+    def getrandbits(self, k):
+        self.draws += 1
+        return super().getrandbits(k)
+
+@dataclass(frozen=True)
+class LayerRecord:
+    section_index: int
+    section_type: str
+    layer: str
+    seconds: float
+    notes: int
+    rng_draws: int
+
+class CompositionProfiler:
+    """
+    Default collector passed as UKHitFactory(profiler=...). Any object with the same record() method works,
+    e.g. one that forwards straight to a metrics client.
+    """
+    def __init__(self):
+        self.records = []
+
+    def record(self, section_index, section_type, layer, seconds, notes, rng_draws):
+        self.records.append(LayerRecord(section_index, section_type, layer, seconds, notes, rng_draws))
+
+    def by_layer(self):
+        """ {layer: {'calls', 'seconds', 'notes', 'rng_draws'}} summed over the song. """
+        totals = {}
+        for rec in self.records:
+            entry = totals.setdefault(rec.layer, {'calls': 0, 'seconds': 0.0, 'notes': 0, 'rng_draws': 0})
+            entry['calls'] += 1; entry['seconds'] += rec.seconds; entry['notes'] += rec.notes; entry['rng_draws'] += rec.rng_draws
+        return totals
+
+    def by_section(self):
+        """ [(section_index, section_type, {layer: seconds})] in composition order. """
+        sections = {}
+        for rec in self.records:
+            layers = sections.setdefault((rec.section_index, rec.section_type), {})
+            layers[rec.layer] = layers.get(rec.layer, 0.0) + rec.seconds
+        return [(index, section_type, layers) for (index, section_type), layers in sorted(sections.items())]
+
+    def dominant_layer(self):
+        """ The top-level instrument layer with the most wall time, or None before anything was recorded. """
+        totals = self.by_layer()
+        timed = [(totals[layer]['seconds'], layer) for layer in TOP_LEVEL_LAYERS if layer in totals]
+        return max(timed)[1] if timed else None
+
+def measure(profiler, rng, notes, section, layer, fn, *args, **kwargs):
+    """ Calls fn and reports its wall time, notes appended to `notes` and draws taken from `rng` (a CountingRandom). """
+    first_note = len(notes); first_draw = rng.draws; started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.record(section[0], section[1], layer, time.perf_counter() - started, len(notes) - first_note, rng.draws - first_draw)
+
+def profiled_generator(layer):
+    """
+    Decorator for melody generator generate() functions. Active only when the factory put a 'profiler'
+    into factory_params; otherwise it is one dict lookup.
+    """
+    def decorate(generate):
+        @functools.wraps(generate)
+        def wrapper(midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params):
+            profiler = factory_params.get('profiler')
+            if profiler is None: return generate(midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params)
+            return measure(profiler, factory_params['rng'], midi_obj, factory_params['profile_section'], layer,
+                           generate, midi_obj, track_num, chord_prog, start_time_beats, section_type, section_profile, factory_params)
+        return wrapper
+    return decorate
@@ -0,0 +1,207 @@
+# song_params.py
+"""
+User-facing generation parameters: enumerated choices, range-checked ints and canonical defaults. SongParams.from_mapping()
+normalizes raw form/query/JSON values and raises ParameterError on the first bad one, before any generation work.
+The result is frozen and hashable, and as_dict() gives the plain dict UKHitFactory, cache keys and batch manifests use.
+"""
+import os
+import re
+from dataclasses import asdict, dataclass, fields
+from enum import Enum
+
+import melody_generators
+import parameter_tables
+
+class ParameterError(ValueError):
+    def __init__(self, field, message):
+        super().__init__(f"{field}: {message}")
+        self.field = field; self.message = message
+
+    def __reduce__(self): # Raised in generation pool workers, so it must pickle
+        return (type(self), (self.field, self.message))
+
+class Genre(str, Enum):
+    MODERN_POP = "ModernPop"
+    POP_ROCK = "PopRock"
+    EDM_PULSE = "EDMPulse"
+    HIP_HOP_GROOVE = "HipHopGroove"
+    BALLAD = "Ballad"
+    RETRO_SYNTHWAVE = "RetroSynthwave"
+
+class Mood(str, Enum):
+    UPLIFTING_ENERGETIC = "UpliftingEnergetic"
+    HAPPY_BRIGHT = "HappyBright"
+    NEUTRAL_REFLECTIVE = "NeutralReflective"
+    MELANCHOLY_SENTIMENTAL = "MelancholySentimental"
+    DARK_INTENSE = "DarkIntense"
+
+class TempoPreference(str, Enum):
+    ANY = "Any"
+    VERY_SLOW = "VerySlow"
+    SLOW = "Slow"
+    MEDIUM = "Medium"
+    FAST = "Fast"
+    VERY_FAST = "VeryFast"
+
+class SongLength(str, Enum):
+    SHORT = "Short"
+    RADIO = "Radio"
+    STANDARD = "Standard"
+    EXTENDED = "Extended"
+
+class StructuralComplexity(str, Enum):
+    SIMPLE = "Simple"
+    STANDARD = "Standard"
+    DEVELOPED = "Developed"
+
+class HarmonicRichness(str, Enum):
+    TRIADS_ONLY = "TriadsOnly"
+    SOME_7THS = "Some7ths"
+    MOSTLY_7THS = "Mostly7ths"
+
+class InstrumentationFocus(str, Enum):
+    BALANCED = "Balanced"
+    PIANO_LED = "PianoLed"
+    SYNTH_HEAVY = "SynthHeavy"
+    GUITAR_FOCUSED = "GuitarFocused"
+    MINIMALIST = "Minimalist"
+
+class RenderMode(str, Enum):
+    SEQUENTIAL = "sequential"
+    UNITS = "units"
+
+class Layer(str, Enum):
+    DRUMS = "drums"
+    BASS = "bass"
+    CHORDS = "chords"
+    MELODY = "melody"
+    PAD = "pad"
+
+MAX_SEED = 2**63 - 1
+LEVEL_RANGE = (1, 5) # energy_level and melodic_complexity
+STYLE_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+REROLL_SECTION = re.compile(r"[0-9]{1,3}|[A-Za-z][A-Za-z0-9_]{0,31}") # A section index or a section type
+MARKOV_STYLE_DIR = os.path.join(os.path.dirname(melody_generators.__file__), "markov_styles") # markov_generator.STYLE_DIR, without importing it
+
+# Choice fields and their enums. Values are stored as the enum's plain string so params stay JSON- and comparison-friendly.
+CHOICES = {
+    'tempo_preference': TempoPreference, 'song_length': SongLength, 'structural_complexity': StructuralComplexity,
+    'harmonic_richness': HarmonicRichness, 'instrumentation_focus': InstrumentationFocus, 'render_mode': RenderMode,
+}
+# Genres and moods can be added through parameter table config files, so they are checked against the active tables
+# (whose built-in lists match Genre and Mood).
+TABLE_CHOICES = {'primary_genre': 'genres', 'mood': 'moods'}
+# Only written by as_dict() when set, so requests that don't use them keep their existing cache keys.
+OPTIONAL_FIELDS = ('markov_style', 'section_reuse', 'section_variation', 'render_mode', 'rerolls')
+
+@dataclass(frozen=True)
+class SongParams:
+    seed: int = None # None until the caller picks one; see with_seed()
+    primary_genre: str = Genre.MODERN_POP.value
+    mood: str = Mood.UPLIFTING_ENERGETIC.value
+    energy_level: int = 3
+    tempo_preference: str = TempoPreference.MEDIUM.value
+    song_length: str = SongLength.RADIO.value
+    structural_complexity: str = StructuralComplexity.STANDARD.value
+    melodic_complexity: int = 3
+    harmonic_richness: str = HarmonicRichness.SOME_7THS.value
+    instrumentation_focus: str = InstrumentationFocus.BALANCED.value
+    melody_generation_style: str = melody_generators.DEFAULT_GENERATOR
+    markov_style: str = None
+    section_reuse: bool = None
+    section_variation: float = None
+    render_mode: str = None
+    rerolls: tuple = None # (section, layer, variation) triples; see song_plan.SongPlan.with_rerolls()
+
+    @classmethod
+    def from_mapping(cls, values):
+        """ Normalizes a form/query/JSON mapping. Missing or blank values take the defaults; unknown keys are ignored. """
+        def given(name):
+            value = values.get(name)
+            return None if value is None or (isinstance(value, str) and not value.strip()) else value
+        normalized = {}
+        seed = given('seed')
+        if seed is not None: normalized['seed'] = _integer('seed', seed, 0, MAX_SEED)
+        tables = parameter_tables.get_tables()
+        for name, table_name in TABLE_CHOICES.items():
+            value = given(name)
+            if value is None: continue
+            value = str(value).strip()
+            if value not in tables[table_name]: raise ParameterError(name, f"expected one of {', '.join(tables[table_name])}, got {value!r}")
+            normalized[name] = value
+        for name, choices in CHOICES.items():
+            value = given(name)
+            if value is None: continue
+            try: normalized[name] = choices(str(value).strip()).value
+            except ValueError: raise ParameterError(name, f"expected one of {', '.join(choice.value for choice in choices)}, got {value!r}") from None
+        for name in ('energy_level', 'melodic_complexity'):
+            value = given(name)
+            if value is not None: normalized[name] = _integer(name, value, *LEVEL_RANGE)
+        style = given('melody_generation_style')
+        if style is not None:
+            style = str(style).strip()
+            if style not in melody_generators.available(): raise ParameterError('melody_generation_style', f"unknown melody generator {style!r}")
+            normalized['melody_generation_style'] = style
+        if given('markov_style') is not None:
+            # Style names only: load_style() also takes file paths, which must never come from a request.
+            markov_style = str(given('markov_style')).strip()
+            if not STYLE_NAME.fullmatch(markov_style): raise ParameterError('markov_style', f"expected a style name, got {markov_style!r}")
+            if not os.path.exists(os.path.join(MARKOV_STYLE_DIR, f"{markov_style}.json")): raise ParameterError('markov_style', f"unknown style {markov_style!r}")
+            normalized['markov_style'] = markov_style
+        if given('section_reuse') is not None: normalized['section_reuse'] = _boolean('section_reuse', given('section_reuse'))
+        if given('section_variation') is not None: normalized['section_variation'] = _number('section_variation', given('section_variation'), 0.0, 1.0)
+        if given('rerolls') is not None:
+            # Units are only independent of each other in "units" render mode (the default).
+            if normalized.get('render_mode') == RenderMode.SEQUENTIAL.value: raise ParameterError('rerolls', "re-rolling a unit is not possible with render_mode=sequential")
+            # A re-roll edits one known song; without a seed it would edit a random song nobody has heard.
+            if 'seed' not in normalized: raise ParameterError('rerolls', "re-rolling a unit needs the song's seed")
+            normalized['rerolls'] = _rerolls('rerolls', given('rerolls'))
+        return cls(**normalized)
+
+    def with_seed(self, seed):
+        return SongParams(**{**asdict(self), 'seed': seed})
+
+    def as_dict(self):
+        """ UKHitFactory user_params. Optional fields are omitted while unset. """
+        params = {field.name: getattr(self, field.name) for field in fields(self)}
+        for name in OPTIONAL_FIELDS:
+            if params[name] is None: del params[name]
+        if params['seed'] is None: del params['seed']
+        return params
+
+def _integer(field, value, low, high):
+    if isinstance(value, bool): raise ParameterError(field, f"expected an integer, got {value!r}")
+    if isinstance(value, str):
+        try: value = int(value.strip())
+        except ValueError: raise ParameterError(field, f"expected an integer, got {value!r}") from None
+    elif not isinstance(value, int): raise ParameterError(field, f"expected an integer, got {value!r}")
+    if not low <= value <= high: raise ParameterError(field, f"must be between {low} and {high}, got {value}")
+    return value
+
+def _number(field, value, low, high):
+    try: value = float(value)
+    except (TypeError, ValueError): raise ParameterError(field, f"expected a number, got {value!r}") from None
+    if not low <= value <= high: raise ParameterError(field, f"must be between {low} and {high}, got {value}")
+    return value
+
+def _rerolls(field, value):
+    """ "section:layer:variation" entries, comma-separated in a string or as a list (of strings or triples). """
+    entries = value.split(",") if isinstance(value, str) else value
+    if not isinstance(entries, (list, tuple)) or not entries: raise ParameterError(field, f"expected section:layer:variation entries, got {value!r}")
+    rerolls = []
+    for entry in entries:
+        parts = entry.split(":") if isinstance(entry, str) else entry
+        if not isinstance(parts, (list, tuple)) or len(parts) != 3: raise ParameterError(field, f"expected section:layer:variation, got {entry!r}")
+        section, layer, variation = (str(part).strip() for part in parts)
+        if not REROLL_SECTION.fullmatch(section): raise ParameterError(field, f"expected a section index or type, got {section!r}")
+        try: layer = Layer(layer).value
+        except ValueError: raise ParameterError(field, f"expected a layer ({', '.join(choice.value for choice in Layer)}), got {layer!r}") from None
+        rerolls.append((int(section) if section.isdigit() else section, layer, _integer(field, variation, 0, MAX_SEED)))
+    return tuple(rerolls)
+
+def _boolean(field, value):
+    if isinstance(value, bool): return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "on"): return True
+    if text in ("0", "false", "no", "off"): return False
+    raise ParameterError(field, f"expected a boolean, got {value!r}")
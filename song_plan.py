@@ -0,0 +1,190 @@
+# song_plan.py
+"""
+SongPlan: everything UKHitFactory decides before it writes a note (resolved params, form, bar lengths, section
+profiles, modulations, chord progressions and hook motifs), as a small serializable value. UKHitFactory.plan() produces one
+without generating notes, and render_plan() turns one back into a composed factory, so songs can be archived as
+plans (to_bytes() is zlib-compressed JSON) and re-rendered on demand, or rendered as several arrangement variants.
+with_rerolls() re-rolls single (section, layer) units; with a UnitCache, rendering the edited plan only renders those.
+"""
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+
+from melody_generators.context import MelodyNote
+from music_theory import Chord, ChordType
+from song_params import ParameterError
+
+PLAN_FORMAT = 1
+
+# Resolved params the renderer reads; everything else only feeds planning.
+RENDER_PARAMS = ('seed', 'bpm', 'key_root_original', 'is_major_original', 'key_name_original', 'song_form', 'primary_genre', 'mood',
+                 'rhythm_personality', 'instrumentation_focus', 'instruments', 'overall_dynamic_level', 'melodic_complexity_level',
+                 'melody_generation_method', 'markov_style', 'hook_on_downbeat_strong', 'section_variation', 'harmonic_schema_name',
+                 'use_7th_chords_probability')
+
+@dataclass(frozen=True)
+class SectionPlan:
+    index: int # Position in the song form
+    section_type: str
+    start_beat: float
+    bars: int
+    duration_beats: float # Including any pause after the section
+    key_root: int
+    is_major: bool
+    bridge_is_modulating: bool = False
+    layers: tuple = () # Layer names (midi_generator.LAYERS) in render order
+    profile: dict = None
+    chord_prog: tuple = () # Chord tuples
+    reuse_of: int = None # Index of an earlier section replayed here (section_reuse); such sections have no layers of their own
+
+    def to_dict(self):
+        section = {'index': self.index, 'section_type': self.section_type, 'start_beat': self.start_beat, 'bars': self.bars,
+                   'duration_beats': self.duration_beats, 'key_root': self.key_root, 'is_major': self.is_major}
+        if self.reuse_of is not None: section['reuse_of'] = self.reuse_of
+        else:
+            section.update(bridge_is_modulating=self.bridge_is_modulating, layers=list(self.layers), profile=self.profile,
+                           chord_prog=[[root, int(chord_type), beats] for root, chord_type, beats in self.chord_prog])
+        return section
+
+    @classmethod
+    def from_dict(cls, section):
+        return cls(section['index'], section['section_type'], section['start_beat'], section['bars'], section['duration_beats'],
+                   section['key_root'], section['is_major'], section.get('bridge_is_modulating', False), tuple(section.get('layers', ())),
+                   section.get('profile'), tuple(Chord(root, ChordType(chord_type), beats) for root, chord_type, beats in section.get('chord_prog', ())),
+                   section.get('reuse_of'))
+
+@dataclass(frozen=True)
+class SongPlan:
+    generator_version: str
+    params: dict # RENDER_PARAMS present in the planning factory
+    sections: tuple = field(default=())
+    hook_motifs: tuple = () # (section_type, first_section_index, MelodyNotes) per hook drawn at planning; every unit of that type shares it
+    unit_variants: tuple = () # (section_index, layer, variation) for each re-rolled unit; see with_rerolls()
+
+    @property
+    def seed(self):
+        return self.params['seed']
+
+    @property
+    def total_beats(self):
+        return self.sections[-1].start_beat + self.sections[-1].duration_beats if self.sections else 0
+
+    def hook_motif(self, section):
+        """ (motif, reused) for a section whose type has a planned hook motif that it follows, else None. """
+        for section_type, first_index, motif in self.hook_motifs:
+            if section_type == section.section_type and section.index >= first_index: return motif, section.index > first_index
+        return None
+
+    def unit_variant(self, section_index, layer, default=0):
+        """ The variation a unit renders with: its re-roll if it has one, else default (the render's variant). """
+        for index, unit_layer, variation in self.unit_variants:
+            if index == section_index and unit_layer == layer: return variation
+        return default
+
+    def with_rerolls(self, rerolls):
+        """
+        Returns a copy in which each (section, layer, variation) re-roll renders its units on that variation's RNG
+        substream (variation 0 restores the original). section is a section index or a section type, which re-rolls
+        the layer in every section of that type; a section replaying an earlier one (section_reuse) re-rolls its source.
+        Raises ParameterError when no section matches or none of the matches plays the layer.
+        """
+        variants = {(index, layer): variation for index, layer, variation in self.unit_variants}
+        for selector, layer, variation in rerolls:
+            matched = [section for section in self.sections if (section.index if isinstance(selector, int) else section.section_type) == selector]
+            if not matched: raise ParameterError('rerolls', f"no section {selector!r} in this song")
+            targets = {section.index if section.reuse_of is None else section.reuse_of for section in matched}
+            targets = [index for index in sorted(targets) if layer in self.sections[index].layers]
+            if not targets: raise ParameterError('rerolls', f"section {selector!r} has no {layer} layer in this song")
+            for index in targets:
+                if variation: variants[(index, layer)] = variation
+                else: variants.pop((index, layer), None)
+        return replace(self, unit_variants=tuple((index, layer, variation) for (index, layer), variation in sorted(variants.items())))
+
+    def fingerprint(self):
+        """ Identifies what the plan renders apart from its re-rolls; UnitCache keys start with it. """
+        return hashlib.sha256(replace(self, unit_variants=()).to_json().encode("utf-8")).hexdigest()
+
+    def to_dict(self):
+        plan = {'format': PLAN_FORMAT, 'generator_version': self.generator_version, 'params': self.params,
+                'sections': [section.to_dict() for section in self.sections]}
+        if self.hook_motifs: plan['hook_motifs'] = [[section_type, first_index, [list(note) for note in motif]] for section_type, first_index, motif in self.hook_motifs]
+        if self.unit_variants: plan['unit_variants'] = [list(unit) for unit in self.unit_variants]
+        return plan
+
+    @classmethod
+    def from_dict(cls, plan):
+        if plan.get('format') != PLAN_FORMAT: raise ValueError(f"Unsupported song plan format {plan.get('format')!r}; expected {PLAN_FORMAT}")
+        return cls(plan['generator_version'], dict(plan['params']), tuple(SectionPlan.from_dict(section) for section in plan['sections']),
+                   tuple((section_type, first_index, tuple(MelodyNote(*note) for note in motif)) for section_type, first_index, motif in plan.get('hook_motifs', ())),
+                   tuple(tuple(unit) for unit in plan.get('unit_variants', ())))
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def to_bytes(self):
+        """ Compact archival form: zlib-compressed JSON. """
+        return zlib.compress(self.to_json().encode("utf-8"), 9)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.from_json(zlib.decompress(data).decode("utf-8"))
+
+class UnitCache:
+    """
+    Thread-safe LRU of rendered units, keyed by (plan fingerprint, section_index, layer, variation) and bounded by
+    total note events. Cached NoteEventBuffers are shared between songs, so callers copy out of them (extend()) and
+    never modify them.
+    """
+    def __init__(self, max_events=500_000):
+        self.max_events = max_events
+        self._entries = OrderedDict()
+        self._events = 0
+        self._lock = threading.Lock()
+        self.hits = 0; self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            notes = self._entries.get(key)
+            if notes is None: self.misses += 1; return None
+            self._entries.move_to_end(key); self.hits += 1
+            return notes
+
+    def put(self, key, notes):
+        with self._lock:
+            if len(notes) > self.max_events: return
+            previous = self._entries.pop(key, None)
+            if previous is not None: self._events -= len(previous)
+            self._entries[key] = notes; self._events += len(notes)
+            while self._events > self.max_events:
+                _, evicted = self._entries.popitem(last=False)
+                self._events -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'events': self._events, 'max_events': self.max_events, 'hits': self.hits, 'misses': self.misses}
+
+def plan_song(user_params):
+    """
+    Plans a song without generating notes: the plan of the song compose() (and so /generate) renders for user_params.
+    Raises ValueError for render_mode='sequential'.
+    """
+    from midi_generator import UKHitFactory
+    return UKHitFactory(user_params=user_params).plan()
+
+def render_plan(plan, executor=None, variant=0, profiler=None, unit_cache=None):
+    """
+    Renders a plan into a composed UKHitFactory (write_midi() / save_midi() as usual). variant 0 gives the plan's own
+    arrangement; any other number re-renders every unit on different RNG substreams over the same form and harmony.
+    Units found in unit_cache are reused instead of rendered, and newly rendered ones are added to it.
+    """
+    from midi_generator import UKHitFactory
+    hit_generator = UKHitFactory(plan=plan, variant=variant, profiler=profiler, unit_cache=unit_cache)
+    hit_generator.compose(executor=executor)
+    return hit_generator
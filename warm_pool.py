@@ -0,0 +1,134 @@
+# warm_pool.py
+"""
+Pre-rendered songs for seedless ("surprise me") requests. Such a request only asks for some new song with the given
+params, so any song rendered from those params and a fresh random seed will do. WarmPool keeps up to `size` of them
+per stocked combination (a seedless SongParams, by default every genre x mood x length with the other fields at
+their defaults), take() hands one out instantly and a background thread renders its replacement. take_any() serves
+requests that ask for any song at all ("Surprise Me"). Rendering goes through the GenerationPool when there is one,
+so refills never hold the GIL of the request threads, as background jobs that only use idle workers.
+"""
+import itertools
+import logging
+import random
+import threading
+from collections import deque
+from typing import NamedTuple
+
+import parameter_tables
+from generation_pool import PoolBusy, render_song
+from song_params import SongLength, SongParams
+
+logger = logging.getLogger(__name__)
+
+class WarmSong(NamedTuple):
+    seed: int
+    midi_bytes: bytes
+    song_params: SongParams # The seedless combination it was rendered for
+
+def default_combinations():
+    """ Every genre x mood x song length of the active parameter tables, other fields at their defaults. """
+    tables = parameter_tables.get_tables()
+    return [SongParams(primary_genre=genre, mood=mood, song_length=length.value)
+            for genre, mood, length in itertools.product(tables['genres'], tables['moods'], SongLength)]
+
+class WarmPool:
+    """
+    Up to size songs per combination, and at most max_bytes of .mid data in total. A refill is only rendered when a
+    song the size of the last one rendered still fits; otherwise its combination waits until take() frees memory (and
+    a render that turns out too big is dropped). Refills run one at a time on a daemon thread, started by start(); a
+    busy GenerationPool or a failed render backs off for retry_seconds and tries again.
+    """
+    def __init__(self, combinations=None, size=2, max_bytes=16 * 1024 * 1024, generation_pool=None, retry_seconds=1.0):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.generation_pool = generation_pool
+        self.retry_seconds = retry_seconds
+        self._songs = {combination: deque() for combination in (default_combinations() if combinations is None else combinations)}
+        self._bytes = 0
+        # One entry per missing song. Round-robin, so every combination gets a first song before any gets a second.
+        self._refills = deque(combination for _ in range(size) for combination in self._songs)
+        self._over_cap = deque() # Refills waiting for memory, oldest first
+        self._song_bytes = 0 # Size of the last rendered song, the estimate for the next one
+        self._rng = random.Random()
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.hits = 0; self.misses = 0; self.refilled = 0; self.dropped = 0; self.failed = 0
+
+    def start(self):
+        with self._wakeup:
+            if self._thread is not None: return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="warm-pool-refill", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._wakeup:
+            thread, self._thread = self._thread, None
+            self._stopping = True; self._wakeup.notify_all()
+        if thread is not None: thread.join(timeout)
+
+    def take(self, song_params):
+        """ A WarmSong for a seedless SongParams, or None when its combination is not stocked or is empty right now. """
+        with self._wakeup:
+            songs = self._songs.get(song_params)
+            if not songs:
+                self.misses += 1
+                return None
+            return self._hand_out(songs)
+
+    def take_any(self):
+        """ A WarmSong of a random stocked combination, or None when every combination is empty right now. """
+        with self._wakeup:
+            stocked = [songs for songs in self._songs.values() if songs]
+            if not stocked:
+                self.misses += 1
+                return None
+            return self._hand_out(self._rng.choice(stocked))
+
+    def _hand_out(self, songs):
+        song = songs.popleft(); self.hits += 1
+        self._bytes -= len(song.midi_bytes)
+        self._refills.append(song.song_params)
+        self._wakeup.notify()
+        return song
+
+    def _has_room(self):
+        return self._bytes + self._song_bytes <= self.max_bytes
+
+    def _render(self, generation_params):
+        if self.generation_pool is not None: return self.generation_pool.render(generation_params, background=True)[0]
+        return render_song(generation_params)[0]
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._stopping and not self._refills and not (self._over_cap and self._has_room()): self._wakeup.wait()
+                if self._stopping: return
+                combination = self._over_cap.popleft() if self._over_cap and self._has_room() else self._refills.popleft()
+                if len(self._songs[combination]) >= self.size: continue
+                if not self._has_room(): # Checked before rendering, so a full pool renders nothing until take() frees memory
+                    self._over_cap.append(combination); continue
+            seed = self._rng.randint(0, 1000000)
+            try:
+                midi_bytes = self._render(combination.with_seed(seed).as_dict())
+            except Exception as e:
+                if not isinstance(e, PoolBusy):
+                    logger.warning("Warm pool refill failed: %s", e, extra={'event': "warm_pool_failed", 'params': combination.as_dict()})
+                with self._wakeup:
+                    self.failed += 1; self._refills.append(combination)
+                    self._wakeup.wait(self.retry_seconds) # Returns early on stop()
+                continue
+            with self._wakeup:
+                self._song_bytes = len(midi_bytes)
+                if self._bytes + len(midi_bytes) > self.max_bytes:
+                    self.dropped += 1; self._over_cap.append(combination)
+                    continue
+                self._songs[combination].append(WarmSong(seed, midi_bytes, combination)); self._bytes += len(midi_bytes)
+                self.refilled += 1
+
+    def stats(self):
+        with self._wakeup:
+            return {'combinations': len(self._songs), 'songs': sum(len(songs) for songs in self._songs.values()), 'size': self.size,
+                    'bytes': self._bytes, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses, 'refilled': self.refilled,
+                    'pending_refills': len(self._refills), 'waiting_for_memory': len(self._over_cap), 'dropped': self.dropped, 'failed': self.failed}